@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, session
+from flask import Flask, request, jsonify, session, Response, stream_with_context, g, has_request_context
 from flask_cors import CORS
 import json
 import os
@@ -6,8 +6,26 @@ import requests
 from datetime import datetime
 import openai
 import logging
+import hashlib
+import sqlite3
+import threading
+import time
+import math
+import re
+import copy
+import uuid
+import zlib
+from collections import OrderedDict, Counter, deque, namedtuple
+from functools import lru_cache
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
+try:
+    import fcntl
+except ImportError:  # Windows: pantry file updates are only serialized within one process
+    fcntl = None
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -29,15 +47,175 @@ if not OPENAI_API_KEY:
 
 openai.api_key = OPENAI_API_KEY
 
+OPENAI_MODEL = "gpt-4o-search-preview"
+
+# LLM response cache: in-memory LRU tier plus an optional on-disk SQLite tier
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', '512'))
+LLM_CACHE_DB = os.environ.get('LLM_CACHE_DB')
+
+# Time-to-live in seconds for each class of cached LLM response
+LLM_CACHE_TTLS = {
+    'intent': 24 * 60 * 60,
+    'entities': 60 * 60,
+    'intent_entities': 60 * 60,
+    'entities_batch': 60 * 60,
+    'meal_plan': 15 * 60,
+    'default': 5 * 60
+}
+
+# LLM client: per-call timeout, per-request deadline budget and max concurrent calls
+LLM_CALL_TIMEOUT = float(os.environ.get('LLM_CALL_TIMEOUT', '8'))
+LLM_LONG_CALL_TIMEOUT = float(os.environ.get('LLM_LONG_CALL_TIMEOUT', '45'))
+LLM_REQUEST_BUDGET = float(os.environ.get('LLM_REQUEST_BUDGET', '60'))
+
+# Per-call timeout for each class of LLM call: short classification calls get the short
+# timeout, calls that write up to a thousand or more tokens get the long one
+LLM_CALL_TIMEOUTS = {
+    'intent': LLM_CALL_TIMEOUT,
+    'entities': LLM_CALL_TIMEOUT,
+    'intent_entities': LLM_CALL_TIMEOUT,
+    'entities_batch': LLM_LONG_CALL_TIMEOUT,
+    'meal_plan': LLM_LONG_CALL_TIMEOUT,
+    'default': LLM_CALL_TIMEOUT
+}
+LLM_MAX_IN_FLIGHT = int(os.environ.get('LLM_MAX_IN_FLIGHT', '16'))
+
+# Circuit breaker around OpenAI: trips open once the error rate over the recent window
+# reaches the threshold, then sends one half-open probe per cooldown period
+CIRCUIT_BREAKER_WINDOW = int(os.environ.get('CIRCUIT_BREAKER_WINDOW', '20'))
+CIRCUIT_BREAKER_MIN_CALLS = int(os.environ.get('CIRCUIT_BREAKER_MIN_CALLS', '5'))
+CIRCUIT_BREAKER_ERROR_RATE = float(os.environ.get('CIRCUIT_BREAKER_ERROR_RATE', '0.5'))
+CIRCUIT_BREAKER_COOLDOWN = float(os.environ.get('CIRCUIT_BREAKER_COOLDOWN', '30'))
+
+VALID_INTENTS = ['update_pantry', 'check_pantry', 'request_meal_plan', 'add_to_cart', 'clarification']
+
+# Classify intent and extract pantry entities in one LLM call instead of two
+FUSED_INTENT_EXTRACTION = os.environ.get('FUSED_INTENT_EXTRACTION', 'true').lower() == 'true'
+
+# Local intent classifier: the LLM is only asked when its confidence is below the threshold
+INTENT_EXAMPLES_FILE = os.environ.get(
+    'INTENT_EXAMPLES_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'intent_examples.json')
+)
+INTENT_CONFIDENCE_THRESHOLD = float(os.environ.get('INTENT_CONFIDENCE_THRESHOLD', '0.85'))
+
+# Server-side session state: the cookie only carries a session id. Sessions are kept in SQLite, so they
+# survive restarts and are shared between workers, with an in-memory LRU checked against it on every
+# read. Setting SESSION_DB to an empty value keeps them only in this process's memory (single worker).
+SESSION_DB = os.environ.get('SESSION_DB', '../data/sessions.db') or None
+SESSION_CACHE_MAX_ENTRIES = int(os.environ.get('SESSION_CACHE_MAX_ENTRIES', '1024'))
+SESSION_TTL = int(os.environ.get('SESSION_TTL', str(7 * 24 * 60 * 60)))
+
+# zlib level for session fields and LLM responses stored on disk
+STATE_COMPRESSION_LEVEL = int(os.environ.get('STATE_COMPRESSION_LEVEL', '6'))
+
+# Pantry storage location, relative to the backend directory
+PANTRY_FILE = os.environ.get('PANTRY_FILE', '../data/pantry.json')
+
+# Optional SQLite database holding a separate pantry per household instead of the shared file
+PANTRY_DB = os.environ.get('PANTRY_DB')
+
+# Attempts at an optimistic pantry update before it waits for the write lock instead
+PANTRY_UPDATE_RETRIES = int(os.environ.get('PANTRY_UPDATE_RETRIES', '5'))
+
+# Most messages accepted by one /chat-with-agent/batch request
+CHAT_BATCH_MAX_MESSAGES = int(os.environ.get('CHAT_BATCH_MAX_MESSAGES', '50'))
+
+# Records per write when importing a pantry from NDJSON, and how many bad lines are reported
+PANTRY_IMPORT_BATCH_SIZE = int(os.environ.get('PANTRY_IMPORT_BATCH_SIZE', '500'))
+PANTRY_IMPORT_MAX_ERRORS = 20
+
+# Pantry versions remembered per process so GET /pantry?since= can answer with only the changes
+PANTRY_DELTA_HISTORY = int(os.environ.get('PANTRY_DELTA_HISTORY', '256'))
+
+# Journal records appended before the pantry journal is folded into a new snapshot
+PANTRY_JOURNAL_COMPACT_AFTER = int(os.environ.get('PANTRY_JOURNAL_COMPACT_AFTER', '200'))
+
+# Lines per LLM call when extracting pantry entities from pasted lists and receipts
+PANTRY_BATCH_CHUNK_SIZE = int(os.environ.get('PANTRY_BATCH_CHUNK_SIZE', '20'))
+
+# Maximum estimated tokens of pantry listing included in the recipe prompt
+PANTRY_PROMPT_TOKEN_BUDGET = int(os.environ.get('PANTRY_PROMPT_TOKEN_BUDGET', '400'))
+
+# Ingredient synonyms (canonical name -> variants) and how many normalized names are memoized
+INGREDIENT_SYNONYMS_FILE = os.environ.get(
+    'INGREDIENT_SYNONYMS_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ingredient_synonyms.json')
+)
+INGREDIENT_NAME_CACHE_SIZE = int(os.environ.get('INGREDIENT_NAME_CACHE_SIZE', '4096'))
+
+# Pantry indexes kept for ingredient availability checks, one per distinct set of item names
+PANTRY_INDEX_CACHE_ENTRIES = int(os.environ.get('PANTRY_INDEX_CACHE_ENTRIES', '64'))
+
+# Minimum trigram similarity (0-1) for a fuzzy ingredient match against the pantry
+INGREDIENT_MATCH_THRESHOLD = float(os.environ.get('INGREDIENT_MATCH_THRESHOLD', '0.6'))
+
+# Distinct recipe measure strings ("1/4 cup", "3 cloves") whose parsed form is memoized
+MEASURE_CACHE_SIZE = int(os.environ.get('MEASURE_CACHE_SIZE', '2048'))
+
+# Ingredients that signal a pantry item is relevant to a requested cuisine
+CUISINE_INGREDIENTS = {
+    'Italian': {'pasta', 'tomato', 'basil', 'olive oil', 'garlic', 'parmesan', 'mozzarella', 'oregano',
+                'cheese', 'onion', 'rice', 'balsamic vinegar', 'pancetta', 'zucchini', 'mushroom'},
+    'Mexican': {'tortilla', 'bean', 'black bean', 'corn', 'avocado', 'lime', 'cilantro', 'jalapeno',
+                'tomato', 'onion', 'rice', 'cumin', 'chili powder', 'cheese', 'chicken', 'beef', 'salsa'},
+    'Chinese': {'rice', 'soy sauce', 'ginger', 'garlic', 'scallion', 'green onion', 'sesame oil', 'tofu',
+                'noodle', 'bok choy', 'egg', 'chicken', 'pork', 'broccoli', 'oyster sauce', 'rice vinegar'}
+}
+
+# Intent cache keyed on a normalized fingerprint of the message
+INTENT_CACHE_MAX_ENTRIES = int(os.environ.get('INTENT_CACHE_MAX_ENTRIES', '2048'))
+
+# Words dropped from message fingerprints; they don't change what the user wants
+INTENT_STOPWORDS = {
+    'a', 'an', 'the', 'i', 'im', 'ive', 'me', 'my', 'we', 'were', 'our', 'us', 'you', 'your',
+    'is', 'are', 'am', 'was', 'be', 'been', 'do', 'does', 'did', 'can', 'could', 'would', 'will',
+    'please', 'just', 'some', 'any', 'and', 'so', 'it', 'its', 'this', 'that', 'these', 'those',
+    'in', 'on', 'of', 'for', 'to', 'at', 'from', 'with', 'there', 'here', 'hey', 'hi', 'ok', 'okay'
+}
+
+# Opening words that make a message a question; the fingerprint marks questions so that
+# "Do I have eggs?" and "I have eggs" don't share a cached intent once stopwords are dropped
+QUESTION_WORDS = {
+    'what', 'whats', 'how', 'hows', 'which', 'where', 'when', 'who', 'why', 'do', 'does', 'did',
+    'is', 'isnt', 'are', 'arent', 'am', 'was', 'were', 'can', 'could', 'would', 'will', 'should', 'any'
+}
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class LazySessionField:
+    """
+    SessionState attribute that is only decoded from its stored JSON on first access
+    """
+    def __init__(self, default):
+        self.default = default
+    
+    def __set_name__(self, owner, name):
+        self.name = name
+    
+    def __get__(self, state, owner=None):
+        if state is None:
+            return self
+        if self.name not in state._values:
+            raw = state._raw.get(self.name)
+            state._values[self.name] = json.loads(raw) if raw is not None else self.default()
+        return state._values[self.name]
+    
+    def __set__(self, state, value):
+        state._values[self.name] = value
+
 class SessionState:
-    def __init__(self):
-        self.pantry = {}
-        self.current_meal_plan = []
-        self.current_shopping_list = []
-        self.user_preferences = {}
+    FIELDS = ('pantry', 'current_meal_plan', 'current_shopping_list', 'user_preferences')
+    
+    pantry = LazySessionField(dict)
+    current_meal_plan = LazySessionField(list)
+    current_shopping_list = LazySessionField(list)
+    user_preferences = LazySessionField(dict)
+    
+    def __init__(self, raw_fields=None, expires_at=None):
+        # Stored JSON text per field; fields never touched are never decoded or re-encoded
+        self._raw = dict(raw_fields or {})
+        self._values = {}
+        self.expires_at = expires_at
         
     def to_dict(self):
         return {
@@ -52,47 +230,1333 @@ class SessionState:
         self.current_meal_plan = data.get('current_meal_plan', [])
         self.current_shopping_list = data.get('current_shopping_list', [])
         self.user_preferences = data.get('user_preferences', {})
+    
+    def dirty_fields(self):
+        """
+        JSON text of every field whose value differs from what was loaded, including
+        fields changed in place. Only fields that were accessed need comparing.
+        """
+        dirty = {}
+        for field, value in self._values.items():
+            raw = dump_state_json(value)
+            if raw != self._raw.get(field, dump_state_json(getattr(SessionState, field).default())):
+                dirty[field] = raw
+        return dirty
+    
+    def mark_clean(self, fields):
+        self._raw.update(fields)
+
+def session_id():
+    if 'sid' not in session:
+        session['sid'] = uuid.uuid4().hex
+    return session['sid']
 
 def get_session_state():
-    if 'state' not in session:
-        session['state'] = SessionState().to_dict()
+    sid = session.get('sid')
+    loaded = session_store.get_fields(sid) if sid else None
+    if loaded is not None:
+        return SessionState(*loaded)
+    
     state = SessionState()
-    state.from_dict(session['state'])
+    # Sessions started before the server-side store carry their state in the cookie
+    legacy = session.pop('state', None)
+    if legacy:
+        state.from_dict(legacy)
+        save_session_state(state)
     return state
 
 def save_session_state(state):
-    session['state'] = state.to_dict()
+    """
+    Persist only the fields that changed; a request that changed nothing writes nothing
+    """
+    fields = state.dirty_fields()
+    if not fields:
+        session_store.skip_write(session.get('sid'), state.expires_at)
+        return
+    state.expires_at = session_store.set_fields(session_id(), fields)
+    state.mark_clean(fields)
+
+class PantryFileCache:
+    """
+    Process-level copy of the pantry file, keyed on the file's stat signature
+    (inode, mtime, size) so it is only re-read after the file changes on disk
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.signature = None
+        self.pantry = None
+        self.hits = 0
+        self.reloads = 0
+    
+    @staticmethod
+    def file_signature(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    
+    def get(self, signature):
+        with self._lock:
+            if signature is not None and signature == self.signature:
+                self.hits += 1
+                # Callers mutate the pantry they get back, so hand out a copy
+                return dict(self.pantry)
+        return None
+    
+    def set(self, signature, pantry, reloaded=False):
+        with self._lock:
+            if reloaded:
+                self.reloads += 1
+            if signature is None:
+                self.signature = None
+                self.pantry = None
+            else:
+                self.signature = signature
+                self.pantry = dict(pantry)
+    
+    def clear(self):
+        with self._lock:
+            self.signature = None
+            self.pantry = None
+            self.hits = 0
+            self.reloads = 0
+    
+    def stats(self):
+        return {'hits': self.hits, 'reloads': self.reloads}
+
+pantry_cache = PantryFileCache()
+
+class PantryFileLock:
+    """
+    Exclusive lock around pantry file read-modify-writes. Re-entrant within a thread, and held
+    with flock on a sidecar file so gunicorn workers sharing the pantry file also wait.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._handle = None
+    
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                os.makedirs(os.path.dirname(PANTRY_FILE) or '.', exist_ok=True)
+                self._handle = open(PANTRY_FILE + '.lock', 'a')
+                fcntl.flock(self._handle, fcntl.LOCK_EX)
+            except OSError:
+                if self._handle is not None:
+                    self._handle.close()
+                    self._handle = None
+                self._lock.release()
+                raise
+        self._depth += 1
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self._depth -= 1
+        if self._depth == 0 and self._handle is not None:
+            fcntl.flock(self._handle, fcntl.LOCK_UN)
+            self._handle.close()
+            self._handle = None
+        self._lock.release()
+
+pantry_file_lock = PantryFileLock()
+
+class PantryJournal:
+    """
+    Append-only log of pantry changes next to the snapshot file. Each record holds the
+    new quantity of every item a save touched (null for removed items), so replaying a
+    record twice is harmless and a crash mid-append only loses the torn last line.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records = 0
+        self.appends = 0
+        self.compactions = 0
+        self.pending_compaction = None
+    
+    @staticmethod
+    def path():
+        return PANTRY_FILE + '.journal'
+    
+    def signature(self):
+        snapshot = pantry_cache.file_signature(PANTRY_FILE)
+        journal = pantry_cache.file_signature(self.path())
+        if snapshot is None and journal is None:
+            return None
+        return (snapshot, journal)
+    
+    def read(self):
+        """
+        Replay the journal on top of the snapshot
+        """
+        pantry = {}
+        if os.path.exists(PANTRY_FILE):
+            with open(PANTRY_FILE, 'r') as f:
+                pantry = json.load(f)
+        
+        records = 0
+        if pantry_cache.file_signature(self.path()) is not None:
+            with open(self.path(), 'r') as f:
+                for line in f:
+                    try:
+                        changes = json.loads(line)['set']
+                    except (ValueError, KeyError, TypeError):
+                        logger.warning("Skipping unreadable pantry journal record")
+                        continue
+                    for item, quantity in changes.items():
+                        if quantity is None:
+                            pantry.pop(item, None)
+                        else:
+                            pantry[item] = quantity
+                    records += 1
+        self.records = records
+        return pantry
+    
+    def append(self, pantry, items):
+        record = json.dumps({'set': {item: pantry.get(item) for item in items}})
+        with pantry_file_lock:
+            os.makedirs(os.path.dirname(PANTRY_FILE) or '.', exist_ok=True)
+            self._truncate_torn_record()
+            with open(self.path(), 'a') as f:
+                f.write(record + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.records += 1
+            self.appends += 1
+            pantry_cache.set(self.signature(), pantry)
+        
+        if self.records >= PANTRY_JOURNAL_COMPACT_AFTER:
+            self.schedule_compaction()
+    
+    def _truncate_torn_record(self):
+        """
+        Cut a partial last line left by a crash mid-append, so the next record starts on
+        its own line instead of being glued onto the fragment and lost with it
+        """
+        if pantry_cache.file_signature(self.path()) is None:
+            return
+        with open(self.path(), 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) == b'\n':
+                return
+            f.seek(0)
+            content = f.read()
+            f.truncate(content.rfind(b'\n') + 1)
+            f.flush()
+            os.fsync(f.fileno())
+        logger.warning("Dropped a torn pantry journal record")
+    
+    def write_snapshot(self, pantry):
+        """
+        Atomically replace the snapshot with the given pantry and start a fresh journal
+        """
+        with pantry_file_lock:
+            self._replace_snapshot(pantry)
+    
+    def compact(self):
+        """
+        Fold the journal into the snapshot
+        """
+        with pantry_file_lock:
+            self._replace_snapshot(self.read())
+            self.compactions += 1
+    
+    def _replace_snapshot(self, pantry):
+        os.makedirs(os.path.dirname(PANTRY_FILE) or '.', exist_ok=True)
+        temp_file = PANTRY_FILE + '.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(pantry, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, PANTRY_FILE)
+        # Journal records are idempotent, so a crash before this removal just replays them again
+        if os.path.exists(self.path()):
+            os.remove(self.path())
+        self.records = 0
+        pantry_cache.set(self.signature(), pantry)
+    
+    def schedule_compaction(self):
+        with self._lock:
+            if self.pending_compaction is not None and not self.pending_compaction.done():
+                return self.pending_compaction
+            self.pending_compaction = pantry_compactor.submit(self.compact)
+            return self.pending_compaction
+    
+    def reset(self):
+        with self._lock:
+            self.records = 0
+            self.appends = 0
+            self.compactions = 0
+            self.pending_compaction = None
+    
+    def stats(self):
+        return {'records': self.records, 'appends': self.appends, 'compactions': self.compactions}
+
+pantry_journal = PantryJournal()
+pantry_compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pantry-compactor')
+
+class SQLitePantryStore:
+    """
+    Pantry storage in SQLite (WAL mode) with one row per household item. Items are indexed on
+    their normalized name so single items and name ranges can be read without the whole pantry.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS pantry_items '
+                '(household_id TEXT NOT NULL, item TEXT NOT NULL, normalized_item TEXT NOT NULL, '
+                'quantity NUMERIC NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (household_id, item))'
+            )
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS pantry_items_normalized ON pantry_items (household_id, normalized_item)'
+            )
+            # Bumped on every write so read-modify-write cycles can detect a concurrent update
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS pantry_versions '
+                '(household_id TEXT PRIMARY KEY, version INTEGER NOT NULL)'
+            )
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        # WAL keeps readers off the writers' lock; NORMAL only syncs at checkpoints
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+    
+    def load(self, household_id):
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT item, quantity FROM pantry_items WHERE household_id = ? ORDER BY rowid', (household_id,)
+            ).fetchall()
+        return dict(rows)
+    
+    def iter_items(self, household_id, batch_size=500):
+        """
+        Yield (item, quantity) pairs for the household, fetching rows a batch at a time
+        """
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                'SELECT item, quantity FROM pantry_items WHERE household_id = ? ORDER BY rowid', (household_id,)
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+    
+    def get(self, household_id, name):
+        """
+        Items in the household's pantry whose normalized name matches the given name
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT item, quantity FROM pantry_items WHERE household_id = ? AND normalized_item = ?',
+                (household_id, normalize_ingredient_name(name))
+            ).fetchall()
+        return dict(rows)
+    
+    def range(self, household_id, start, end=None):
+        """
+        Items whose normalized name sorts in [start, end), in name order
+        """
+        query = 'SELECT item, quantity FROM pantry_items WHERE household_id = ? AND normalized_item >= ?'
+        params = [household_id, start]
+        if end is not None:
+            query += ' AND normalized_item < ?'
+            params.append(end)
+        with self._connect() as conn:
+            rows = conn.execute(query + ' ORDER BY normalized_item, item', params).fetchall()
+        return dict(rows)
+    
+    def version(self, household_id, conn=None):
+        if conn is None:
+            with self._connect() as conn:
+                return self.version(household_id, conn)
+        row = conn.execute('SELECT version FROM pantry_versions WHERE household_id = ?', (household_id,)).fetchone()
+        return row[0] if row else 0
+    
+    def _bump_version(self, conn, household_id, expected=None):
+        """
+        Increment the household's version, or return False if it is no longer the expected one
+        """
+        if expected is None:
+            conn.execute(
+                'INSERT INTO pantry_versions (household_id, version) VALUES (?, 1) '
+                'ON CONFLICT (household_id) DO UPDATE SET version = version + 1',
+                (household_id,)
+            )
+            return True
+        if expected == 0:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO pantry_versions (household_id, version) VALUES (?, 1)', (household_id,)
+            )
+        else:
+            cursor = conn.execute(
+                'UPDATE pantry_versions SET version = version + 1 WHERE household_id = ? AND version = ?',
+                (household_id, expected)
+            )
+        return cursor.rowcount == 1
+    
+    def _write_items(self, conn, household_id, quantities):
+        now = time.time()
+        removed = [(household_id, item) for item, quantity in quantities.items() if quantity is None]
+        updated = [
+            (household_id, item, normalize_ingredient_name(item), quantity, now)
+            for item, quantity in quantities.items() if quantity is not None
+        ]
+        conn.executemany('DELETE FROM pantry_items WHERE household_id = ? AND item = ?', removed)
+        conn.executemany(
+            'INSERT INTO pantry_items (household_id, item, normalized_item, quantity, updated_at) '
+            'VALUES (?, ?, ?, ?, ?) ON CONFLICT (household_id, item) '
+            'DO UPDATE SET quantity = excluded.quantity, updated_at = excluded.updated_at',
+            updated
+        )
+    
+    def upsert(self, household_id, quantities):
+        """
+        Set the quantity of each given item in one transaction; a quantity of None removes the item
+        """
+        with self._connect() as conn:
+            self._bump_version(conn, household_id)
+            self._write_items(conn, household_id, quantities)
+    
+    def mutate(self, household_id, update, retries=None):
+        """
+        Read the household's pantry, let update() change it in place and write back only the
+        items that changed. The write commits only if the household's version is unchanged
+        since the read; otherwise the cycle is retried on fresh data, and the last attempt
+        holds the write lock throughout. Returns the updated pantry.
+        """
+        retries = PANTRY_UPDATE_RETRIES if retries is None else retries
+        for attempt in range(retries + 1):
+            conn = self._connect()
+            try:
+                pessimistic = attempt == retries
+                if pessimistic:
+                    conn.execute('BEGIN IMMEDIATE')
+                version = self.version(household_id, conn)
+                before = dict(conn.execute(
+                    'SELECT item, quantity FROM pantry_items WHERE household_id = ? ORDER BY rowid', (household_id,)
+                ).fetchall())
+                pantry = dict(before)
+                update(pantry)
+                changes = {item: pantry.get(item) for item in set(before) | set(pantry)
+                           if before.get(item) != pantry.get(item)}
+                if not changes:
+                    conn.rollback()
+                    return pantry
+                
+                if not self._bump_version(conn, household_id, expected=version):
+                    conn.rollback()
+                    pantry_update_stats['conflicts'] += 1
+                    continue
+                self._write_items(conn, household_id, changes)
+                conn.commit()
+                return pantry
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+    
+    def load_with_version(self, household_id):
+        """
+        The household's pantry and the version it was read at, from one consistent snapshot
+        """
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN')
+            version = self.version(household_id, conn)
+            rows = conn.execute(
+                'SELECT item, quantity FROM pantry_items WHERE household_id = ? ORDER BY rowid', (household_id,)
+            ).fetchall()
+            conn.rollback()
+        finally:
+            conn.close()
+        return dict(rows), version
+    
+    def replace(self, household_id, pantry):
+        now = time.time()
+        with self._connect() as conn:
+            self._bump_version(conn, household_id)
+            conn.execute('DELETE FROM pantry_items WHERE household_id = ?', (household_id,))
+            conn.executemany(
+                'INSERT INTO pantry_items (household_id, item, normalized_item, quantity, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(household_id, item, normalize_ingredient_name(item), quantity, now)
+                 for item, quantity in pantry.items()]
+            )
+
+pantry_store = SQLitePantryStore(PANTRY_DB) if PANTRY_DB else None
+pantry_update_stats = Counter()
+
+def current_household_id():
+    """
+    Household whose pantry this request reads and writes, assigned once per session
+    """
+    if not has_request_context():
+        return 'default'
+    if 'household_id' not in session:
+        session['household_id'] = uuid.uuid4().hex
+    return session['household_id']
 
 def load_pantry():
-    pantry_file = '../data/pantry.json'
-    if os.path.exists(pantry_file):
-        with open(pantry_file, 'r') as f:
-            return json.load(f)
-    return {}
+    if pantry_store is not None:
+        return pantry_store.load(current_household_id())
+    
+    if not os.path.exists(PANTRY_FILE) and not os.path.exists(pantry_journal.path()):
+        return {}
+    
+    signature = pantry_journal.signature()
+    cached = pantry_cache.get(signature)
+    if cached is not None:
+        return cached
+    
+    pantry = pantry_journal.read()
+    pantry_cache.set(signature, pantry, reloaded=True)
+    return pantry
 
-def save_pantry(pantry):
-    pantry_file = '../data/pantry.json'
-    os.makedirs(os.path.dirname(pantry_file), exist_ok=True)
-    with open(pantry_file, 'w') as f:
-        json.dump(pantry, f, indent=2)
+def save_pantry(pantry, changed_items=None):
+    """
+    Persist the pantry. When the items that changed are known only they are written (appended
+    to the journal, or upserted in the SQLite store); otherwise the whole pantry is replaced.
+    """
+    if pantry_store is not None:
+        if changed_items is None:
+            pantry_store.replace(current_household_id(), pantry)
+        elif changed_items:
+            pantry_store.upsert(current_household_id(), {item: pantry.get(item) for item in changed_items})
+        return
+    
+    if changed_items is None:
+        pantry_journal.write_snapshot(pantry)
+    elif changed_items:
+        pantry_journal.append(pantry, changed_items)
 
-def call_openai_with_fallback(messages, temperature=0.3, max_tokens=500):
+def pantry_version():
     """
-    Call OpenAI API with error handling and fallback
+    Opaque version of the current pantry that changes whenever it is written
     """
-    try:
-        # Remove temperature parameter if it's not supported by the model
-        params = {
-            "model": "gpt-4o-search-preview",
-            "messages": messages,
-            "max_tokens": max_tokens
+    if pantry_store is not None:
+        return str(pantry_store.version(current_household_id()))
+    signature = pantry_journal.signature()
+    if signature is None:
+        return 'empty'
+    return hashlib.sha256(repr(signature).encode('utf-8')).hexdigest()[:16]
+
+def load_pantry_with_version():
+    if pantry_store is not None:
+        pantry, version = pantry_store.load_with_version(current_household_id())
+        return pantry, str(version)
+    # Writers hold the lock, so the pantry can't change between the read and the version
+    with pantry_file_lock:
+        return load_pantry(), pantry_version()
+
+def apply_pantry_entities(pantry, entities):
+    """
+    Apply extracted add/remove entities to a pantry dict in place, under canonical item names
+    """
+    for entity in entities:
+        item = lemmatize_ingredient(entity['item'])
+        quantity = entity['quantity']
+        action = entity['action']
+        
+        # Fold in quantities stored under the raw name before pantry keys were canonical
+        if item != entity['item'] and entity['item'] in pantry:
+            pantry[item] = pantry.get(item, 0) + pantry.pop(entity['item'])
+        
+        if action == 'add':
+            pantry[item] = pantry.get(item, 0) + quantity
+        elif action == 'remove':
+            if item in pantry:
+                if quantity == 0 or pantry[item] <= quantity:
+                    # Remove the item completely (spoiled, expired, used up, etc.)
+                    del pantry[item]
+                else:
+                    # Subtract the quantity, but don't go below zero
+                    pantry[item] = max(0, pantry[item] - quantity)
+    return pantry
+
+def update_pantry_entities(entities):
+    """
+    Apply add/remove entities to the stored pantry as one atomic read-modify-write, so
+    concurrent updates from other threads or workers are never lost. Returns the new pantry.
+    """
+    if pantry_store is not None:
+        return pantry_store.mutate(current_household_id(), lambda pantry: apply_pantry_entities(pantry, entities))
+    
+    with pantry_file_lock:
+        pantry = load_pantry()
+        apply_pantry_entities(pantry, entities)
+        changed_items = [entity['item'] for entity in entities]
+        changed_items += [lemmatize_ingredient(item) for item in changed_items if lemmatize_ingredient(item) != item]
+        save_pantry(pantry, changed_items)
+    return pantry
+
+def set_pantry_quantities(quantities):
+    """
+    Set the quantity of each given item in the stored pantry in one write; a quantity of
+    None removes the item
+    """
+    if pantry_store is not None:
+        pantry_store.upsert(current_household_id(), quantities)
+        return
+    
+    with pantry_file_lock:
+        pantry = load_pantry()
+        for item, quantity in quantities.items():
+            if quantity is None:
+                pantry.pop(item, None)
+            else:
+                pantry[item] = quantity
+        save_pantry(pantry, list(quantities))
+
+def parse_pantry_record(line):
+    """
+    Parse one NDJSON import line into (item, quantity); a quantity of 0 or null means
+    the item is removed. Raises ValueError for malformed records.
+    """
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("Expected a JSON object")
+    item = record.get('item')
+    if not isinstance(item, str) or not item.strip():
+        raise ValueError("Missing 'item'")
+    quantity = record.get('quantity')
+    if quantity is not None and (isinstance(quantity, bool) or not isinstance(quantity, (int, float)) or quantity < 0):
+        raise ValueError("'quantity' must be a non-negative number or null")
+    return item.strip(), (quantity or None)
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU cache with optional per-entry expiry
+    """
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+    
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
         }
+
+# Header of compressed state blobs; plain JSON text never starts with a NUL byte
+STATE_BLOB_MAGIC = b'\x00GG'
+STATE_BLOB_VERSION = 1
+
+state_encoding_stats = Counter()
+
+def dump_state_json(value):
+    return json.dumps(value, separators=(',', ':'))
+
+def encode_state(text):
+    """
+    Encode JSON text for storage: zlib-compressed behind a magic/version header, or left
+    as plain UTF-8 JSON when compression doesn't make it smaller
+    """
+    raw = text.encode('utf-8')
+    compressed = STATE_BLOB_MAGIC + bytes([STATE_BLOB_VERSION]) + zlib.compress(raw, STATE_COMPRESSION_LEVEL)
+    encoded = compressed if len(compressed) < len(raw) else raw
+    state_encoding_stats['encoded'] += 1
+    state_encoding_stats['raw_bytes'] += len(raw)
+    state_encoding_stats['encoded_bytes'] += len(encoded)
+    return encoded
+
+def decode_state(blob):
+    """
+    Decode a stored value written by encode_state, or plain JSON text from before it existed
+    """
+    if isinstance(blob, str):
+        return blob
+    if blob.startswith(STATE_BLOB_MAGIC):
+        version = blob[len(STATE_BLOB_MAGIC)]
+        if version != STATE_BLOB_VERSION:
+            raise ValueError(f"Unsupported state blob version {version}")
+        return zlib.decompress(blob[len(STATE_BLOB_MAGIC) + 1:]).decode('utf-8')
+    return blob.decode('utf-8')
+
+def state_encoding_metrics():
+    raw_bytes = state_encoding_stats['raw_bytes']
+    return {
+        'encoded': state_encoding_stats['encoded'],
+        'raw_bytes': raw_bytes,
+        'encoded_bytes': state_encoding_stats['encoded_bytes'],
+        'ratio': round(state_encoding_stats['encoded_bytes'] / raw_bytes, 3) if raw_bytes else 1.0
+    }
+
+class ResponseCache:
+    """
+    Two-tier cache for LLM responses: an in-memory LRU in front of an optional SQLite file.
+    Each entry class (intent, entities, meal_plan, ...) expires after its own TTL.
+    """
+    def __init__(self, max_entries=512, db_path=None, ttls=None):
+        self.memory = LRUCache(max_entries)
+        self.db_path = db_path
+        self.ttls = ttls if ttls is not None else LLM_CACHE_TTLS
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS llm_cache '
+                    '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+                )
+                conn.execute('DELETE FROM llm_cache WHERE expires_at <= ?', (time.time(),))
+    
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5)
+    
+    @staticmethod
+    def make_key(model, messages, max_tokens):
+        payload = json.dumps([model, messages, max_tokens], sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            with self._lock:
+                self.memory_hits += 1
+            return value
         
-        response = openai.ChatCompletion.create(**params)
-        return response.choices[0].message.content.strip(), None
-    except Exception as e:
-        logger.error(f"OpenAI API error: {str(e)}")
-        return None, str(e)
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        'SELECT value, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?',
+                        (key, time.time())
+                    ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"LLM cache read failed: {e}")
+                row = None
+            if row:
+                value, expires_at = decode_state(row[0]), row[1]
+                # Promote to the memory tier for the rest of the entry's lifetime
+                self.memory.set(key, value, ttl=max(expires_at - time.time(), 1))
+                with self._lock:
+                    self.disk_hits += 1
+                return value
+        
+        with self._lock:
+            self.misses += 1
+        return None
+    
+    def set(self, key, value, cache_class='default'):
+        ttl = self.ttls.get(cache_class, self.ttls.get('default', 300))
+        self.memory.set(key, value, ttl=ttl)
+        
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        'INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                        (key, encode_state(value), time.time() + ttl)
+                    )
+            except sqlite3.Error as e:
+                logger.warning(f"LLM cache write failed: {e}")
+    
+    def clear(self):
+        self.memory.clear()
+        with self._lock:
+            self.memory_hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM llm_cache')
+    
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            'memory_size': len(self.memory),
+            'max_entries': self.memory.max_entries,
+            'evictions': self.memory.evictions,
+            'persistent': bool(self.db_path)
+        }
+
+llm_cache = ResponseCache(max_entries=LLM_CACHE_MAX_ENTRIES, db_path=LLM_CACHE_DB)
+
+class SessionStore:
+    """
+    Server-side session state: an in-memory LRU in front of an optional SQLite file, so the
+    session cookie only has to carry a session id. Each session field is kept as its own JSON
+    text (compressed on disk) so a save can write just the fields that changed. Sessions
+    expire after a period of inactivity.
+    
+    With SQLite every write bumps the session's version, and a read only answers from memory
+    after checking that version, so a session changed by another worker is reloaded rather
+    than served stale. Without SQLite sessions are local to the process.
+    """
+    def __init__(self, max_entries=1024, db_path=None, ttl=SESSION_TTL):
+        self.memory = LRUCache(max_entries)
+        self.db_path = db_path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.skipped_writes = 0
+        if self.db_path:
+            if os.path.dirname(self.db_path):
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            with self._connect() as conn:
+                # sessions.data holds fields stored inline as JSON by older versions
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS sessions '
+                    '(sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL, '
+                    'version INTEGER NOT NULL DEFAULT 0)'
+                )
+                if 'version' not in {column[1] for column in conn.execute('PRAGMA table_info(sessions)')}:
+                    conn.execute('ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS session_fields '
+                    '(sid TEXT NOT NULL, field TEXT NOT NULL, data BLOB NOT NULL, PRIMARY KEY (sid, field))'
+                )
+                conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),))
+                conn.execute('DELETE FROM session_fields WHERE sid NOT IN (SELECT sid FROM sessions)')
+    
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5)
+    
+    def get_fields(self, sid):
+        """
+        The session's stored fields as {field: JSON text}, and when it expires; None if unknown
+        """
+        entry = self.memory.get(sid)
+        if not self.db_path:
+            if entry is not None:
+                with self._lock:
+                    self.memory_hits += 1
+                return dict(entry[0]), entry[1]
+            with self._lock:
+                self.misses += 1
+            return None
+        
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    'SELECT data, expires_at, version FROM sessions WHERE sid = ? AND expires_at > ?',
+                    (sid, time.time())
+                ).fetchone()
+                if row and entry is not None and entry[2] == row[2]:
+                    with self._lock:
+                        self.memory_hits += 1
+                    return dict(entry[0]), row[1]
+                field_rows = conn.execute(
+                    'SELECT field, data FROM session_fields WHERE sid = ?', (sid,)
+                ).fetchall() if row else []
+        except sqlite3.Error as e:
+            logger.warning(f"Session store read failed: {e}")
+            if entry is not None:
+                return dict(entry[0]), entry[1]
+            row = None
+        
+        if row:
+            fields = {field: dump_state_json(value) for field, value in json.loads(row[0]).items()}
+            fields.update((field, decode_state(data)) for field, data in field_rows)
+            self.memory.set(sid, (fields, row[1], row[2]), ttl=max(row[1] - time.time(), 1))
+            with self._lock:
+                self.disk_hits += 1
+            return dict(fields), row[1]
+        
+        self.memory.delete(sid)
+        with self._lock:
+            self.misses += 1
+        return None
+    
+    def get(self, sid):
+        loaded = self.get_fields(sid)
+        if loaded is None:
+            return None
+        return {field: json.loads(raw) for field, raw in loaded[0].items()}
+    
+    def set_fields(self, sid, fields, replace=False):
+        """
+        Merge the given {field: JSON text} into the session (or replace all of its fields)
+        and return the new expiry time
+        """
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self.writes += 1
+            if not self.db_path:
+                entry = self.memory.get(sid)
+                merged = {} if replace or entry is None else dict(entry[0])
+                merged.update(fields)
+                self.memory.set(sid, (merged, expires_at, None), ttl=self.ttl)
+                return expires_at
+        
+        try:
+            with self._connect() as conn:
+                if replace:
+                    conn.execute('DELETE FROM session_fields WHERE sid = ?', (sid,))
+                    conn.execute(
+                        'INSERT OR REPLACE INTO sessions (sid, data, expires_at, version) VALUES '
+                        "(?, '{}', ?, COALESCE((SELECT version FROM sessions WHERE sid = ?), 0) + 1)",
+                        (sid, expires_at, sid)
+                    )
+                else:
+                    # An expired session reusing its id must not bring back its old fields
+                    now = time.time()
+                    conn.execute(
+                        'DELETE FROM session_fields WHERE sid IN '
+                        '(SELECT sid FROM sessions WHERE sid = ? AND expires_at <= ?)',
+                        (sid, now)
+                    )
+                    conn.execute(
+                        "INSERT INTO sessions (sid, data, expires_at, version) VALUES (?, '{}', ?, 1) "
+                        "ON CONFLICT (sid) DO UPDATE SET expires_at = excluded.expires_at, "
+                        "version = sessions.version + 1, "
+                        "data = CASE WHEN sessions.expires_at <= ? THEN '{}' ELSE sessions.data END",
+                        (sid, expires_at, now)
+                    )
+                conn.executemany(
+                    'INSERT OR REPLACE INTO session_fields (sid, field, data) VALUES (?, ?, ?)',
+                    [(sid, field, encode_state(raw)) for field, raw in fields.items()]
+                )
+                version = conn.execute('SELECT version FROM sessions WHERE sid = ?', (sid,)).fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning(f"Session store write failed: {e}")
+            self.memory.delete(sid)
+            return expires_at
+        
+        with self._lock:
+            entry = self.memory.get(sid)
+            if replace:
+                self.memory.set(sid, (dict(fields), expires_at, version), ttl=self.ttl)
+            elif entry is not None and entry[2] == version - 1:
+                merged = dict(entry[0])
+                merged.update(fields)
+                self.memory.set(sid, (merged, expires_at, version), ttl=self.ttl)
+            else:
+                # Another writer got in between, or the rest of the session isn't in memory:
+                # leave the next read to fetch the merged row from SQLite
+                self.memory.delete(sid)
+        return expires_at
+    
+    def set(self, sid, data):
+        return self.set_fields(sid, {field: dump_state_json(value) for field, value in data.items()}, replace=True)
+    
+    def skip_write(self, sid, expires_at):
+        """
+        Record a save with nothing to write; sessions past half their lifetime still get their
+        expiry pushed back so an active but unchanged session doesn't time out
+        """
+        with self._lock:
+            self.skipped_writes += 1
+        if sid is None or expires_at is None or expires_at - time.time() > self.ttl / 2:
+            return
+        
+        new_expires_at = time.time() + self.ttl
+        entry = self.memory.get(sid)
+        if entry is not None:
+            self.memory.set(sid, (entry[0], new_expires_at, entry[2]), ttl=self.ttl)
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute('UPDATE sessions SET expires_at = ? WHERE sid = ?', (new_expires_at, sid))
+            except sqlite3.Error as e:
+                logger.warning(f"Session store write failed: {e}")
+    
+    def clear(self):
+        self.memory.clear()
+        with self._lock:
+            self.memory_hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+            self.writes = 0
+            self.skipped_writes = 0
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM sessions')
+                conn.execute('DELETE FROM session_fields')
+    
+    def stats(self):
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'writes': self.writes,
+            'skipped_writes': self.skipped_writes,
+            'memory_size': len(self.memory),
+            'persistent': bool(self.db_path)
+        }
+
+session_store = SessionStore(max_entries=SESSION_CACHE_MAX_ENTRIES, db_path=SESSION_DB)
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls: the first caller for a key runs the function,
+    and callers arriving while it is still in flight wait for and share its result
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+    
+    def do(self, key, fn, timeout=None):
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        
+        if not leader:
+            # Waiters get their own copy so nobody mutates a shared result
+            return copy.deepcopy(future.result(timeout=timeout))
+        
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+    
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._in_flight)
+        }
+    
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.coalesced = 0
+
+class CircuitBreaker:
+    """
+    Closed -> open when the error rate over the last `window` calls reaches `error_rate`
+    (after at least `min_calls`). While open every call is short-circuited; after
+    `cooldown` seconds a single half-open probe is let through, and its outcome
+    either closes the breaker or re-opens it for another cooldown.
+    """
+    def __init__(self, window=20, min_calls=5, error_rate=0.5, cooldown=30.0):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self._lock:
+            self.state = 'closed'
+            self.outcomes = deque(maxlen=self.window)
+            self.opened_at = None
+            self.probe_in_flight = False
+            self.short_circuited = 0
+            self.times_opened = 0
+    
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self.probe_in_flight:
+                self.probe_in_flight = True
+                logger.info("Circuit breaker half-open, sending probe")
+                return True
+            self.short_circuited += 1
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logger.info("Circuit breaker closed, OpenAI has recovered")
+                self.state = 'closed'
+                self.outcomes.clear()
+                self.probe_in_flight = False
+            self.outcomes.append(True)
+    
+    def record_failure(self):
+        with self._lock:
+            if self.state != 'closed':
+                self._trip()
+                return
+            self.outcomes.append(False)
+            failures = self.outcomes.count(False)
+            if len(self.outcomes) >= self.min_calls and failures / len(self.outcomes) >= self.error_rate:
+                self._trip()
+    
+    def _trip(self):
+        logger.warning(f"Circuit breaker open, skipping OpenAI for {self.cooldown:.0f}s")
+        self.state = 'open'
+        self.opened_at = time.monotonic()
+        self.probe_in_flight = False
+        self.times_opened += 1
+    
+    def stats(self):
+        with self._lock:
+            calls = len(self.outcomes)
+            return {
+                'state': self.state,
+                'recent_calls': calls,
+                'recent_error_rate': round(self.outcomes.count(False) / calls, 3) if calls else 0.0,
+                'short_circuited': self.short_circuited,
+                'times_opened': self.times_opened
+            }
+
+openai_breaker = CircuitBreaker(
+    window=CIRCUIT_BREAKER_WINDOW,
+    min_calls=CIRCUIT_BREAKER_MIN_CALLS,
+    error_rate=CIRCUIT_BREAKER_ERROR_RATE,
+    cooldown=CIRCUIT_BREAKER_COOLDOWN
+)
+
+# Identical outbound calls that overlap in time share a single request
+llm_flight = SingleFlight()
+recipe_flight = SingleFlight()
+kroger_flight = SingleFlight()
+
+def make_pooled_session(pool_size):
+    """
+    Create a requests session that keeps up to pool_size keep-alive connections per host
+    """
+    http_session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    http_session.mount('https://', adapter)
+    http_session.mount('http://', adapter)
+    return http_session
+
+# Every worker thread shares one connection pool to the OpenAI API
+llm_http_session = make_pooled_session(LLM_MAX_IN_FLIGHT)
+openai.requestssession = llm_http_session
+
+# LLM calls run on this pool so callers can enforce a hard deadline and keep several in flight
+llm_executor = ThreadPoolExecutor(max_workers=LLM_MAX_IN_FLIGHT, thread_name_prefix='llm-call')
+llm_batch_executor = ThreadPoolExecutor(max_workers=LLM_MAX_IN_FLIGHT, thread_name_prefix='llm-batch')
+
+llm_client_stats = Counter()
+llm_client_lock = threading.Lock()
+
+def record_llm_event(event):
+    with llm_client_lock:
+        llm_client_stats[event] += 1
+
+@app.before_request
+def start_llm_deadline():
+    # Every request gets a fixed budget for all of its LLM calls combined
+    g.llm_deadline = time.monotonic() + LLM_REQUEST_BUDGET
+
+def current_llm_deadline():
+    """
+    Return the current request's LLM deadline (a time.monotonic() value), or None outside a request
+    """
+    if has_request_context():
+        return g.get('llm_deadline')
+    return None
+
+def llm_call_timeout(deadline=None, cache_class='default'):
+    """
+    Seconds the next LLM call may take: the call class's timeout, capped by what's left of the deadline
+    """
+    call_timeout = LLM_CALL_TIMEOUTS.get(cache_class, LLM_CALL_TIMEOUTS['default'])
+    if deadline is None:
+        deadline = current_llm_deadline()
+    if deadline is None:
+        return call_timeout
+    return min(call_timeout, deadline - time.monotonic())
+
+def call_openai_with_fallback(messages, temperature=0.3, max_tokens=500, cache_class='default', deadline=None):
+    """
+    Call OpenAI API with error handling and fallback.
+    Successful responses are cached per (model, messages, max_tokens); pass cache_class=None to bypass the cache.
+    The call is abandoned once it exceeds its class's timeout in LLM_CALL_TIMEOUTS or the request's deadline, and skipped
+    entirely while the circuit breaker is open, so callers fall through to their non-LLM
+    fallbacks instead of holding the worker.
+    """
+    cache_key = None
+    if cache_class:
+        cache_key = llm_cache.make_key(OPENAI_MODEL, messages, max_tokens)
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            return cached, None
+    
+    timeout = llm_call_timeout(deadline, cache_class)
+    if timeout <= 0:
+        logger.warning("LLM request deadline exceeded, skipping OpenAI call")
+        record_llm_event('deadline_exceeded')
+        return None, "LLM request deadline exceeded"
+    
+    if not openai_breaker.allow():
+        return None, "OpenAI circuit breaker is open"
+    
+    def request_completion():
+        try:
+            # Remove temperature parameter if it's not supported by the model
+            params = {
+                "model": OPENAI_MODEL,
+                "messages": messages,
+                "max_tokens": max_tokens,
+                "request_timeout": timeout
+            }
+            
+            future = llm_executor.submit(openai.ChatCompletion.create, **params)
+            response = future.result(timeout=timeout)
+            content = response.choices[0].message.content.strip()
+            openai_breaker.record_success()
+            if cache_key:
+                llm_cache.set(cache_key, content, cache_class)
+            return content, None
+        except FutureTimeoutError:
+            future.cancel()
+            logger.error(f"OpenAI API call timed out after {timeout:.1f}s")
+            record_llm_event('timeouts')
+            openai_breaker.record_failure()
+            return None, f"OpenAI API call timed out after {timeout:.1f}s"
+        except Exception as e:
+            logger.error(f"OpenAI API error: {str(e)}")
+            openai_breaker.record_failure()
+            return None, str(e)
+    
+    # Concurrent identical prompts share one in-flight call
+    flight_key = cache_key or llm_cache.make_key(OPENAI_MODEL, messages, max_tokens)
+    try:
+        return llm_flight.do(flight_key, request_completion, timeout=timeout)
+    except FutureTimeoutError:
+        record_llm_event('timeouts')
+        return None, f"OpenAI API call timed out after {timeout:.1f}s"
+
+def call_openai_many(calls, deadline=None):
+    """
+    Run several call_openai_with_fallback calls concurrently under one shared deadline.
+    Each call is a dict of keyword arguments; results come back in the same order.
+    """
+    if deadline is None:
+        deadline = current_llm_deadline()
+    futures = [
+        llm_batch_executor.submit(call_openai_with_fallback, deadline=deadline, **call)
+        for call in calls
+    ]
+    return [future.result() for future in futures]
+
+def stream_openai_with_fallback(messages, max_tokens=500, cache_class='default', deadline=None):
+    """
+    Stream an OpenAI chat completion, yielding content fragments as they arrive.
+    Cached responses are replayed as a single fragment; errors propagate to the caller,
+    including a TimeoutError once the request's deadline passes mid-stream.
+    """
+    cache_key = None
+    if cache_class:
+        cache_key = llm_cache.make_key(OPENAI_MODEL, messages, max_tokens)
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+    
+    if deadline is None:
+        deadline = current_llm_deadline()
+    timeout = llm_call_timeout(deadline, cache_class)
+    if timeout <= 0:
+        record_llm_event('deadline_exceeded')
+        raise TimeoutError("LLM request deadline exceeded")
+    
+    if not openai_breaker.allow():
+        raise RuntimeError("OpenAI circuit breaker is open")
+    
+    params = {
+        "model": OPENAI_MODEL,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "stream": True,
+        "request_timeout": timeout
+    }
+    
+    content = []
+    responded = False
+    try:
+        for chunk in openai.ChatCompletion.create(**params):
+            if not responded:
+                # The API is answering; a consumer that stops reading early isn't an outage
+                responded = True
+                openai_breaker.record_success()
+            if deadline is not None and time.monotonic() > deadline:
+                record_llm_event('timeouts')
+                raise TimeoutError("LLM request deadline exceeded mid-stream")
+            fragment = chunk['choices'][0]['delta'].get('content')
+            if fragment:
+                content.append(fragment)
+                yield fragment
+    except Exception:
+        openai_breaker.record_failure()
+        raise
+    
+    if not responded:
+        # An empty stream is still an answer; left unrecorded, a half-open probe would never finish
+        openai_breaker.record_success()
+    if cache_key and content:
+        llm_cache.set(cache_key, ''.join(content).strip(), cache_class)
 
 def get_intent_classification_prompt():
     """
@@ -140,84 +1604,490 @@ User message: "{message}"
 
 Respond with only valid JSON:'''
 
+def get_intent_and_entity_prompt():
+    """
+    Return the prompt template for combined intent classification and entity extraction
+    """
+    return '''You are a grocery shopping assistant. Classify the user's message into one of these intents, and if it is update_pantry also extract the food items, quantities, and actions.
+
+Intents:
+- update_pantry: User wants to add, remove, or modify items in their pantry
+- check_pantry: User wants to see what's currently in their pantry
+- request_meal_plan: User wants recipe suggestions or meal planning
+- add_to_cart: User wants to add items to their Kroger shopping cart
+- clarification: Message is unclear or doesn't fit other categories
+
+For update_pantry, each entity has:
+- item: the food item name (normalized, lowercase, singular)
+- quantity: numeric quantity (use 1 if not specified)
+- action: "add" (for buying/adding items) or "remove" (for using up, finishing, spoiling, expiring, running out, or throwing away items)
+
+Examples:
+"I bought 2 onions and a bag of rice" -> {{"intent": "update_pantry", "entities": [{{"item": "onion", "quantity": 2, "action": "add"}}, {{"item": "rice", "quantity": 1, "action": "add"}}]}}
+"I finished the milk and used up 3 eggs" -> {{"intent": "update_pantry", "entities": [{{"item": "milk", "quantity": 0, "action": "remove"}}, {{"item": "egg", "quantity": 3, "action": "remove"}}]}}
+"What's in my pantry?" -> {{"intent": "check_pantry", "entities": []}}
+"I want to cook Italian food tonight" -> {{"intent": "request_meal_plan", "entities": []}}
+"Add these items to my cart" -> {{"intent": "add_to_cart", "entities": []}}
+"Hello" -> {{"intent": "clarification", "entities": []}}
+
+User message: "{message}"
+
+Respond with only valid JSON:'''
+
+def get_batch_entity_extraction_prompt():
+    """
+    Return the prompt template for extracting pantry entities from many numbered lines at once
+    """
+    return '''You are a grocery shopping assistant. Each numbered line below is a separate grocery list entry, receipt line, or pantry update. Extract the food items, quantities, and actions from every line.
+
+For each line return a JSON array of objects containing:
+- item: the food item name (normalized, lowercase, singular)
+- quantity: numeric quantity (use 1 if not specified)
+- action: "add" (for buying/adding items, including plain list or receipt entries) or "remove" (for using up, finishing, spoiling, expiring, running out, or throwing away items)
+Use an empty array for lines that contain no food items (totals, taxes, store names).
+
+Example:
+1. 2 onions
+2. I finished the milk
+3. SUBTOTAL 12.40
+-> {{"1": [{{"item": "onion", "quantity": 2, "action": "add"}}], "2": [{{"item": "milk", "quantity": 0, "action": "remove"}}], "3": []}}
+
+Lines:
+{lines}
+
+Respond with only a valid JSON object mapping every line number to its array:'''
+
+def get_batch_intent_and_entity_prompt():
+    """
+    Return the prompt template for classifying many numbered chat messages at once, with
+    the pantry entities of every update_pantry message
+    """
+    return '''You are a grocery shopping assistant. Each numbered line below is a separate chat message from the user. Classify every message into one of these intents, and for update_pantry messages also extract the food items, quantities, and actions.
+
+Intents:
+- update_pantry: User wants to add, remove, or modify items in their pantry
+- check_pantry: User wants to see what's currently in their pantry
+- request_meal_plan: User wants recipe suggestions or meal planning
+- add_to_cart: User wants to add items to their Kroger shopping cart
+- clarification: Message is unclear or doesn't fit other categories
+
+For update_pantry, each entity has:
+- item: the food item name (normalized, lowercase, singular)
+- quantity: numeric quantity (use 1 if not specified)
+- action: "add" (for buying/adding items) or "remove" (for using up, finishing, spoiling, expiring, running out, or throwing away items)
+
+Example:
+1. I bought 2 onions and a bag of rice
+2. What's in my pantry?
+3. I finished the milk
+-> {{"1": {{"intent": "update_pantry", "entities": [{{"item": "onion", "quantity": 2, "action": "add"}}, {{"item": "rice", "quantity": 1, "action": "add"}}]}}, "2": {{"intent": "check_pantry", "entities": []}}, "3": {{"intent": "update_pantry", "entities": [{{"item": "milk", "quantity": 0, "action": "remove"}}]}}}}
+
+Messages:
+{messages}
+
+Respond with only a valid JSON object mapping every message number to its result:'''
+
+def load_ingredient_aliases(path=INGREDIENT_SYNONYMS_FILE):
+    """
+    Build the reverse alias index (variant -> canonical name) from the synonyms file,
+    which maps each canonical ingredient name to its variants
+    """
+    try:
+        with open(path, 'r') as f:
+            synonyms = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Could not load ingredient synonyms from {path}: {e}, names will only be lowercased")
+        synonyms = {}
+    
+    aliases = {}
+    for canonical, variants in synonyms.items():
+        canonical = canonical.lower().strip()
+        for variant in [canonical] + variants:
+            variant = variant.lower().strip()
+            if aliases.setdefault(variant, canonical) != canonical:
+                logger.warning(f"Ingredient synonym '{variant}' is listed under both '{aliases[variant]}' and '{canonical}'")
+    return aliases
+
+ingredient_aliases = load_ingredient_aliases()
+
+# Plurals the suffix rules below would get wrong
+IRREGULAR_PLURALS = {
+    'leaves': 'leaf', 'loaves': 'loaf', 'halves': 'half', 'knives': 'knife', 'calves': 'calf',
+    'cookies': 'cookie', 'brownies': 'brownie', 'pies': 'pie', 'smoothies': 'smoothie',
+    'geese': 'goose', 'mice': 'mouse', 'teeth': 'tooth', 'feet': 'foot',
+    'shoes': 'shoe', 'canoes': 'canoe'
+}
+
+# Words ending in s that are already singular
+SINGULAR_WORDS = {
+    'brussels', 'molasses', 'swiss', 'hummus', 'couscous', 'asparagus', 'citrus',
+    'hibiscus', 'octopus', 'lemongrass', 'series', 'species'
+}
+
+# Preparation and size words that don't change which ingredient is meant
+INGREDIENT_MODIFIERS = {
+    'fresh', 'freshly', 'chopped', 'diced', 'sliced', 'minced', 'grated', 'shredded', 'crushed',
+    'peeled', 'cubed', 'halved', 'quartered', 'julienned', 'mashed', 'finely', 'roughly', 'thinly',
+    'coarsely', 'large', 'small', 'medium', 'big', 'ripe', 'organic', 'raw', 'cooked', 'uncooked',
+    'frozen', 'thawed', 'boneless', 'skinless', 'trimmed', 'washed', 'rinsed', 'drained', 'softened',
+    'melted', 'beaten', 'extra'
+}
+
+def singularize_word(word):
+    """
+    Rule-based English singular of a lowercase word
+    """
+    if word in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[word]
+    if len(word) <= 3 or word in SINGULAR_WORDS or word.endswith(('ss', 'us', 'is')):
+        return word
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith('oes'):
+        return word[:-2]
+    if word.endswith(('ches', 'shes', 'xes', 'sses')):
+        return word[:-2]
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+@lru_cache(maxsize=INGREDIENT_NAME_CACHE_SIZE)
+def lemmatize_ingredient(name):
+    """
+    Canonical pantry key for an ingredient name: lowercased, preparation and size words
+    dropped, and every word singularized ("Fresh Chopped Tomatoes" -> "tomato")
+    """
+    words = name.lower().replace(',', ' ').split()
+    kept = [word for word in words if word not in INGREDIENT_MODIFIERS] or words
+    return ' '.join(singularize_word(word) for word in kept)
+
+@lru_cache(maxsize=INGREDIENT_NAME_CACHE_SIZE)
 def normalize_ingredient_name(name):
     """
     Normalize ingredient names for better matching
     """
-    # Convert to lowercase and remove common variations
     name = name.lower().strip()
+    if name in ingredient_aliases:
+        return ingredient_aliases[name]
+    lemma = lemmatize_ingredient(name)
+    return ingredient_aliases.get(lemma, lemma)
+
+def name_trigrams(name):
+    return {name[i:i + 3] for i in range(len(name) - 2)}
+
+def word_trigrams(name):
+    """
+    Trigrams of each word padded with spaces, the features fuzzy matching compares
+    """
+    trigrams = set()
+    for word in re.findall(r"[a-z0-9]+", name.lower()):
+        padded = f" {word} "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+class PantryIndex:
+    """
+    Lookup structure over one set of pantry item names: character trigrams of each normalized
+    name point back to the items, so a containment query only checks the few items sharing
+    every trigram with it instead of scanning the pantry. A second inverted index over padded
+    word trigrams scores fuzzy matches ("chopped tomatoes" -> "tomato").
+    """
+    def __init__(self, items):
+        self.items = list(items)
+        self.normalized = [normalize_ingredient_name(item) for item in self.items]
+        self.trigrams = {}
+        for position, name in enumerate(self.normalized):
+            for trigram in name_trigrams(name):
+                self.trigrams.setdefault(trigram, []).append(position)
+        
+        self.word_trigram_counts = []
+        self.word_trigrams = {}
+        for position, name in enumerate(self.normalized):
+            trigrams = word_trigrams(name)
+            self.word_trigram_counts.append(len(trigrams))
+            for trigram in trigrams:
+                self.word_trigrams.setdefault(trigram, []).append(position)
     
-    # Common ingredient variations
-    variations = {
-        'tomato': ['tomatoes', 'tomato'],
-        'onion': ['onions', 'onion'],
-        'garlic': ['garlic', 'garlic clove', 'garlic cloves'],
-        'egg': ['eggs', 'egg'],
-        'milk': ['milk', 'whole milk', 'skim milk'],
-        'butter': ['butter', 'unsalted butter', 'salted butter'],
-        'olive oil': ['olive oil', 'extra virgin olive oil', 'evoo'],
-        'salt': ['salt', 'table salt', 'kosher salt'],
-        'pepper': ['pepper', 'black pepper', 'ground pepper'],
-        'flour': ['flour', 'all purpose flour', 'plain flour'],
-        'sugar': ['sugar', 'white sugar', 'granulated sugar'],
-        'rice': ['rice', 'white rice', 'brown rice'],
-        'pasta': ['pasta', 'spaghetti', 'penne', 'fettuccine'],
-        'chicken': ['chicken', 'chicken breast', 'chicken thighs'],
-        'beef': ['beef', 'ground beef', 'beef steak'],
-        'cheese': ['cheese', 'cheddar cheese', 'mozzarella cheese']
-    }
+    def find_containing(self, query):
+        """
+        First pantry item, in pantry order, whose normalized name contains the query
+        """
+        trigrams = name_trigrams(query)
+        if not trigrams:
+            # Too short to index; these queries are rare and cheap to scan
+            candidates = range(len(self.items))
+        else:
+            postings = sorted((self.trigrams.get(trigram, []) for trigram in trigrams), key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                if not candidates:
+                    break
+                candidates.intersection_update(posting)
+            candidates = sorted(candidates)
+        
+        for position in candidates:
+            if query in self.normalized[position]:
+                return self.items[position]
+        return None
     
-    # Check if the name matches any variation
-    for base_name, variants in variations.items():
-        if name in variants:
-            return base_name
+    def best_match(self, query, threshold=None):
+        """
+        Pantry item most similar to the query and its score, or (None, 0.0) when nothing
+        reaches the threshold. The score is the Dice coefficient of the two names' word
+        trigrams, and every word of each name must closely match a word of the other, so a
+        pantry item named inside a longer ingredient ("milk" in "coconut milk") isn't a match.
+        """
+        threshold = INGREDIENT_MATCH_THRESHOLD if threshold is None else threshold
+        trigrams = word_trigrams(query)
+        if not trigrams:
+            return None, 0.0
+        
+        # Count shared trigrams for every candidate in one pass over the posting lists
+        shared = Counter()
+        for trigram in trigrams:
+            shared.update(self.word_trigrams.get(trigram, ()))
+        
+        scored = []
+        for position, count in shared.items():
+            score = 2 * count / (len(trigrams) + self.word_trigram_counts[position])
+            if score >= threshold:
+                scored.append((-score, position))
+        
+        for negative_score, position in sorted(scored):
+            if words_align(query, self.normalized[position], threshold):
+                return self.items[position], round(-negative_score, 3)
+        return None, 0.0
+
+def words_align(first, second, threshold):
+    """
+    Whether every word of each name has a counterpart in the other that could be a typo of
+    it: word trigram Dice similarity of at least the threshold and a length within two
+    characters, which keeps compounds like "buttermilk" from matching "butter"
+    """
+    first_words = re.findall(r"[a-z0-9]+", first.lower())
+    second_words = re.findall(r"[a-z0-9]+", second.lower())
     
-    return name
+    def similar(word, other):
+        if abs(len(word) - len(other)) > 2:
+            return False
+        trigrams, other_trigrams = word_trigrams(word), word_trigrams(other)
+        return 2 * len(trigrams & other_trigrams) / (len(trigrams) + len(other_trigrams)) >= threshold
+    
+    return (all(any(similar(word, other) for other in second_words) for word in first_words)
+            and all(any(similar(word, other) for other in first_words) for word in second_words))
+
+# Indexes keyed on the household's pantry version, or on the item names in order for pantries
+# without one; quantities are read from the live pantry, so only item changes need a new index
+pantry_index_cache = LRUCache(PANTRY_INDEX_CACHE_ENTRIES)
 
-def check_ingredient_availability(ingredient_name, pantry_items):
+def get_pantry_index(pantry_items, version=None):
     """
-    Check if an ingredient is available in the pantry, accounting for variations
+    Index over the pantry's item names, built once per pantry version. Pass the version that
+    was loaded with the pantry (load_pantry_with_version) to look it up without touching the
+    items; otherwise the lookup key is built from every item name.
+    """
+    if version is not None:
+        key = ('version', current_household_id(), version)
+    else:
+        key = tuple(pantry_items)
+    index = pantry_index_cache.get(key)
+    if index is None:
+        index = PantryIndex(pantry_items)
+        pantry_index_cache.set(key, index)
+    return index
+
+def find_pantry_item(ingredient_name, pantry_items, index=None):
+    """
+    Name of the pantry item that supplies an ingredient, accounting for variations, or None.
+    Callers checking many ingredients pass the pantry's index so it's only looked up once.
     """
     normalized_name = normalize_ingredient_name(ingredient_name)
     
     # Check exact match first
     if ingredient_name in pantry_items:
-        return True, pantry_items[ingredient_name]
+        return ingredient_name
     
     # Check normalized match
     if normalized_name in pantry_items:
-        return True, pantry_items[normalized_name]
+        return normalized_name
     
     # Check if any pantry item contains the ingredient name
-    for pantry_item, quantity in pantry_items.items():
-        if normalized_name in normalize_ingredient_name(pantry_item):
-            return True, quantity
+    if index is None:
+        index = get_pantry_index(pantry_items)
+    pantry_item = index.find_containing(normalized_name)
+    if pantry_item is not None:
+        return pantry_item
     
-    return False, 0
+    # Fall back to the closest fuzzy match
+    pantry_item, _ = index.best_match(normalized_name)
+    return pantry_item
 
-def recognize_intent(message):
+def check_ingredient_availability(ingredient_name, pantry_items, index=None):
     """
-    LLM-powered intent recognition with fallback to keyword matching
+    Check if an ingredient is available in the pantry, accounting for variations
     """
-    prompt = get_intent_classification_prompt().format(message=message)
-    messages = [{"role": "user", "content": prompt}]
+    pantry_item = find_pantry_item(ingredient_name, pantry_items, index)
+    if pantry_item is None:
+        return False, 0
+    return True, pantry_items[pantry_item]
+
+class LocalIntentClassifier:
+    """
+    Multinomial naive Bayes over word, word-bigram and character-trigram features.
+    predict() returns (intent, confidence); confidence is scaled down by the share of
+    the message's features never seen in training, so unfamiliar messages go to the LLM.
+    """
+    def __init__(self, examples=None, alpha=0.5, sharpness=8.0):
+        self.alpha = alpha
+        self.sharpness = sharpness
+        self.intents = []
+        self.feature_counts = {}
+        self.feature_totals = {}
+        self.log_priors = {}
+        self.vocabulary = set()
+        if examples:
+            self.train(examples)
     
-    response, error = call_openai_with_fallback(messages, temperature=0.1, max_tokens=50)
+    @staticmethod
+    def features(text):
+        words = re.findall(r"[a-z0-9]+", text.lower().replace("'", ""))
+        features = [f"w:{word}" for word in words]
+        features += [f"b:{first} {second}" for first, second in zip(words, words[1:])]
+        for word in words:
+            padded = f"#{word}#"
+            features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+        return features
     
-    if response:
-        # Clean response and validate
-        intent = response.lower().strip()
-        valid_intents = ['update_pantry', 'check_pantry', 'request_meal_plan', 'add_to_cart', 'clarification']
+    def train(self, examples):
+        """
+        Train from a mapping of intent -> list of example messages
+        """
+        total_examples = sum(len(texts) for texts in examples.values())
+        for intent, texts in examples.items():
+            counts = Counter()
+            for text in texts:
+                counts.update(self.features(text))
+            self.feature_counts[intent] = counts
+            self.feature_totals[intent] = sum(counts.values())
+            self.log_priors[intent] = math.log(len(texts) / total_examples)
+            self.vocabulary.update(counts)
+        self.intents = list(examples)
+    
+    def predict(self, text):
+        features = self.features(text)
+        known = [feature for feature in features if feature in self.vocabulary]
+        if not self.intents or not known:
+            return None, 0.0
         
-        if intent in valid_intents:
-            logger.info(f"LLM classified intent: {intent}")
-            return intent
-        else:
-            logger.warning(f"LLM returned invalid intent: {intent}, falling back to keyword matching")
-    else:
-        logger.warning(f"LLM intent recognition failed: {error}, falling back to keyword matching")
+        vocabulary_size = len(self.vocabulary)
+        scores = {}
+        for intent in self.intents:
+            counts = self.feature_counts[intent]
+            log_denominator = math.log(self.feature_totals[intent] + self.alpha * vocabulary_size)
+            score = self.log_priors[intent]
+            for feature in known:
+                score += math.log(counts.get(feature, 0) + self.alpha) - log_denominator
+            # Length-normalize so long messages don't get overconfident posteriors
+            scores[intent] = score / len(known)
+        
+        best_score = max(scores.values())
+        weights = {intent: math.exp((score - best_score) * self.sharpness) for intent, score in scores.items()}
+        best_intent = max(weights, key=weights.get)
+        confidence = weights[best_intent] / sum(weights.values()) * len(known) / len(features)
+        return best_intent, confidence
+
+def load_intent_classifier(path=INTENT_EXAMPLES_FILE):
+    """
+    Build the local intent classifier from the labeled examples shipped with the backend
+    """
+    try:
+        with open(path, 'r') as f:
+            examples = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Could not load intent examples from {path}: {e}, local intent classifier disabled")
+        examples = None
+    return LocalIntentClassifier(examples)
+
+local_intent_classifier = load_intent_classifier()
+
+# How many intents each tier of the cascade resolved (fingerprint cache, local classifier, LLM, keyword fallback)
+intent_tier_counts = Counter()
+intent_tier_lock = threading.Lock()
+
+def record_intent_tier(tier):
+    with intent_tier_lock:
+        intent_tier_counts[tier] += 1
+
+intent_cache = LRUCache(INTENT_CACHE_MAX_ENTRIES)
+
+def message_fingerprint(message):
+    """
+    Canonical form of a message for intent caching: lowercase, punctuation and
+    stopwords removed, tokens sorted, and questions prefixed with "?".
+    "What's in my pantry??" -> "? pantry whats"
+    """
+    text = message.lower().replace("'", "").replace("\u2019", "")
+    tokens = re.findall(r"[a-z0-9]+", text)
+    fingerprint = ' '.join(sorted(token for token in tokens if token not in INTENT_STOPWORDS))
+    if fingerprint and ('?' in text or tokens[0] in QUESTION_WORDS):
+        return '? ' + fingerprint
+    return fingerprint
+
+def lookup_cached_intent(fingerprint):
+    if not fingerprint:
+        return None
+    intent = intent_cache.get(fingerprint)
+    if intent:
+        logger.info(f"Intent cache hit: {intent}")
+        record_intent_tier('cache')
+    return intent
+
+def remember_intent(fingerprint, intent):
+    # Only classifier and LLM answers are cached; keyword fallbacks are retried next time
+    if fingerprint:
+        intent_cache.set(fingerprint, intent)
+
+def classify_intent_locally(message):
+    """
+    Return the local classifier's intent if it clears the confidence threshold, otherwise None
+    """
+    intent, confidence = local_intent_classifier.predict(message)
+    if intent and confidence >= INTENT_CONFIDENCE_THRESHOLD:
+        logger.info(f"Local classifier resolved intent: {intent} ({confidence:.2f})")
+        record_intent_tier('local')
+        return intent
+    return None
+
+def validate_intent(response):
+    """
+    Normalize a raw intent label from the LLM, returning None if it isn't a known intent
+    """
+    if not isinstance(response, str):
+        return None
+    intent = response.lower().strip()
+    return intent if intent in VALID_INTENTS else None
+
+def validate_pantry_entities(entities):
+    """
+    Keep only well-formed pantry entities, returning None if the payload isn't a list
+    """
+    if not isinstance(entities, list):
+        return None
     
-    # Fallback to keyword matching
+    valid_entities = []
+    for entity in entities:
+        if (isinstance(entity, dict) and 
+            'item' in entity and 'quantity' in entity and 'action' in entity and
+            isinstance(entity['item'], str) and entity['item'].strip() and
+            entity['action'] in ['add', 'remove'] and
+            isinstance(entity['quantity'], (int, float))):
+            valid_entities.append(entity)
+    return valid_entities
+
+def keyword_intent(message):
+    """
+    Keyword-matching intent recognition used when the LLM is unavailable
+    """
     message_lower = message.lower()
     
     if any(word in message_lower for word in ['pantry', 'have', 'inventory', 'bought', 'finished', 'added', 'removed']):
@@ -233,6 +2103,71 @@ def recognize_intent(message):
     
     return 'clarification'
 
+def recognize_intent(message, deadline=None):
+    """
+    Intent recognition cascade: fingerprint cache, local classifier, then the LLM, then keyword matching
+    """
+    fingerprint = message_fingerprint(message)
+    intent = lookup_cached_intent(fingerprint)
+    if intent:
+        return intent
+    
+    intent = classify_intent_locally(message)
+    if intent:
+        remember_intent(fingerprint, intent)
+        return intent
+    
+    prompt = get_intent_classification_prompt().format(message=message)
+    messages = [{"role": "user", "content": prompt}]
+    
+    response, error = call_openai_with_fallback(messages, temperature=0.1, max_tokens=50, cache_class='intent', deadline=deadline)
+    
+    if response:
+        # Clean response and validate
+        intent = validate_intent(response)
+        
+        if intent:
+            logger.info(f"LLM classified intent: {intent}")
+            record_intent_tier('llm')
+            remember_intent(fingerprint, intent)
+            return intent
+        else:
+            logger.warning(f"LLM returned invalid intent: {response.lower().strip()}, falling back to keyword matching")
+    else:
+        logger.warning(f"LLM intent recognition failed: {error}, falling back to keyword matching")
+    
+    # Fallback to keyword matching
+    record_intent_tier('keyword')
+    return keyword_intent(message)
+
+def parse_pantry_entities_simple(message):
+    """
+    Simple pattern-based entity extraction used when the LLM is unavailable
+    """
+    entities = []
+    
+    # Simple patterns for demo
+    if 'bought' in message.lower() or 'added' in message.lower():
+        # Extract items after "bought" or "added"
+        words = message.lower().split()
+        for i, word in enumerate(words):
+            if word in ['bought', 'added'] and i + 1 < len(words):
+                # Simple extraction - look for numbers and items
+                if words[i + 1].isdigit():
+                    quantity = int(words[i + 1])
+                    if i + 2 < len(words):
+                        item = words[i + 2].rstrip('.,')
+                        entities.append({"item": item, "quantity": quantity, "action": "add"})
+    
+    if 'finished' in message.lower() or 'removed' in message.lower():
+        words = message.lower().split()
+        for i, word in enumerate(words):
+            if word in ['finished', 'removed'] and i + 1 < len(words):
+                item = words[i + 1].rstrip('.,')
+                entities.append({"item": item, "quantity": 0, "action": "remove"})
+    
+    return entities
+
 def extract_pantry_entities(message):
     """
     LLM-powered entity extraction with fallback to simple parsing
@@ -240,23 +2175,15 @@ def extract_pantry_entities(message):
     prompt = get_entity_extraction_prompt().format(message=message)
     messages = [{"role": "user", "content": prompt}]
     
-    response, error = call_openai_with_fallback(messages, temperature=0.1, max_tokens=300)
+    response, error = call_openai_with_fallback(messages, temperature=0.1, max_tokens=300, cache_class='entities')
     
     if response:
         try:
             # Try to parse JSON response
-            entities = json.loads(response)
+            valid_entities = validate_pantry_entities(json.loads(response))
             
             # Validate structure
-            if isinstance(entities, list):
-                valid_entities = []
-                for entity in entities:
-                    if (isinstance(entity, dict) and 
-                        'item' in entity and 'quantity' in entity and 'action' in entity and
-                        entity['action'] in ['add', 'remove'] and
-                        isinstance(entity['quantity'], (int, float))):
-                        valid_entities.append(entity)
-                
+            if valid_entities is not None:
                 if valid_entities:
                     logger.info(f"LLM extracted {len(valid_entities)} entities")
                     return valid_entities
@@ -270,29 +2197,104 @@ def extract_pantry_entities(message):
         logger.warning(f"LLM entity extraction failed: {error}, falling back to simple parsing")
     
     # Fallback to simple parsing
-    entities = []
+    return parse_pantry_entities_simple(message)
+
+def extract_pantry_entities_batch(lines, chunk_size=None):
+    """
+    Extract pantry entities for many lines using a few concurrent LLM calls of
+    chunk_size lines each. Returns one (entities, source) pair per line, where
+    source is "llm", or "fallback" when that line's LLM result was missing or invalid.
+    """
+    if chunk_size is None:
+        chunk_size = PANTRY_BATCH_CHUNK_SIZE
+    chunks = [lines[start:start + chunk_size] for start in range(0, len(lines), chunk_size)]
     
-    # Simple patterns for demo
-    if 'bought' in message.lower() or 'added' in message.lower():
-        # Extract items after "bought" or "added"
-        words = message.lower().split()
-        for i, word in enumerate(words):
-            if word in ['bought', 'added'] and i + 1 < len(words):
-                # Simple extraction - look for numbers and items
-                if words[i + 1].isdigit():
-                    quantity = int(words[i + 1])
-                    if i + 2 < len(words):
-                        item = words[i + 2].rstrip('.,')
-                        entities.append({"item": item, "quantity": quantity, "action": "add"})
+    calls = []
+    for chunk in chunks:
+        numbered = "\n".join(f"{number}. {line}" for number, line in enumerate(chunk, 1))
+        prompt = get_batch_entity_extraction_prompt().format(lines=numbered)
+        calls.append({
+            'messages': [{"role": "user", "content": prompt}],
+            'temperature': 0.1,
+            'max_tokens': min(4000, 60 * len(chunk) + 100),
+            'cache_class': 'entities_batch'
+        })
     
-    if 'finished' in message.lower() or 'removed' in message.lower():
-        words = message.lower().split()
-        for i, word in enumerate(words):
-            if word in ['finished', 'removed'] and i + 1 < len(words):
-                item = words[i + 1].rstrip('.,')
-                entities.append({"item": item, "quantity": 0, "action": "remove"})
+    results = []
+    for chunk, (response, error) in zip(chunks, call_openai_many(calls)):
+        by_line = {}
+        if response:
+            try:
+                parsed = json.loads(response)
+                if isinstance(parsed, dict):
+                    by_line = parsed
+                else:
+                    logger.warning("LLM batch response is not an object, falling back to simple parsing")
+            except json.JSONDecodeError as e:
+                logger.warning(f"LLM returned invalid JSON for batch: {e}, falling back to simple parsing")
+        else:
+            logger.warning(f"LLM batch entity extraction failed: {error}, falling back to simple parsing")
+        
+        for number, line in enumerate(chunk, 1):
+            entities = validate_pantry_entities(by_line.get(str(number)))
+            if entities is not None:
+                results.append((entities, 'llm'))
+            else:
+                results.append((parse_pantry_entities_simple(line), 'fallback'))
     
-    return entities
+    return results
+
+def classify_and_extract(message, deadline=None):
+    """
+    Classify intent and extract pantry entities in a single LLM round trip.
+    Returns (intent, entities); entities is None unless the LLM returned a valid
+    entity list for an update_pantry message, so callers can fall back to
+    extract_pantry_entities. A cached or confident local classification skips the LLM entirely.
+    """
+    fingerprint = message_fingerprint(message)
+    intent = lookup_cached_intent(fingerprint) or classify_intent_locally(message)
+    if intent:
+        remember_intent(fingerprint, intent)
+        return intent, None
+    
+    prompt = get_intent_and_entity_prompt().format(message=message)
+    messages = [{"role": "user", "content": prompt}]
+    
+    response, error = call_openai_with_fallback(
+        messages, temperature=0.1, max_tokens=300, cache_class='intent_entities', deadline=deadline
+    )
+    
+    if not response:
+        logger.warning(f"LLM classify-and-extract failed: {error}, falling back to keyword matching")
+        record_intent_tier('keyword')
+        return keyword_intent(message), None
+    
+    try:
+        result = json.loads(response)
+    except json.JSONDecodeError as e:
+        logger.warning(f"LLM returned invalid JSON: {e}, falling back to keyword matching")
+        record_intent_tier('keyword')
+        return keyword_intent(message), None
+    
+    intent = validate_intent(result.get('intent')) if isinstance(result, dict) else None
+    if not intent:
+        logger.warning(f"LLM returned invalid classify-and-extract result: {result}, falling back to keyword matching")
+        record_intent_tier('keyword')
+        return keyword_intent(message), None
+    
+    logger.info(f"LLM classified intent: {intent}")
+    record_intent_tier('llm')
+    remember_intent(fingerprint, intent)
+    if intent != 'update_pantry':
+        return intent, None
+    
+    entities = validate_pantry_entities(result.get('entities'))
+    if entities:
+        logger.info(f"LLM extracted {len(entities)} entities")
+        return intent, entities
+    
+    logger.warning("LLM returned invalid entity structure, falling back to entity extraction")
+    return intent, None
 
 def fetch_recipes(cuisine=None, dietary_restrictions=None, num_meals=3):
     """
@@ -305,45 +2307,168 @@ def fetch_recipes(cuisine=None, dietary_restrictions=None, num_meals=3):
     else:
         url = f"{base_url}/search.php?s="
     
-    try:
-        response = requests.get(url)
-        data = response.json()
-        
-        if data.get('meals'):
-            meals = data['meals'][:num_meals]
-            recipes = []
+    def fetch():
+        try:
+            response = requests.get(url)
+            data = response.json()
             
-            for meal in meals:
-                recipe = {
-                    'id': meal['idMeal'],
-                    'name': meal['strMeal'],
-                    'image': meal['strMealThumb'],
-                    'ingredients': []
-                }
+            if data.get('meals'):
+                meals = data['meals'][:num_meals]
+                recipes = []
                 
-                # Extract ingredients and measures
-                for i in range(1, 21):  # TheMealDB has up to 20 ingredients
-                    ingredient = meal.get(f'strIngredient{i}')
-                    measure = meal.get(f'strMeasure{i}')
+                for meal in meals:
+                    recipe = {
+                        'id': meal['idMeal'],
+                        'name': meal['strMeal'],
+                        'image': meal['strMealThumb'],
+                        'ingredients': []
+                    }
+                    
+                    # Extract ingredients and measures
+                    for i in range(1, 21):  # TheMealDB has up to 20 ingredients
+                        ingredient = meal.get(f'strIngredient{i}')
+                        measure = meal.get(f'strMeasure{i}')
+                        
+                        if ingredient and ingredient.strip():
+                            recipe['ingredients'].append({
+                                'name': ingredient.strip(),
+                                'measure': measure.strip() if measure else ''
+                            })
                     
-                    if ingredient and ingredient.strip():
-                        recipe['ingredients'].append({
-                            'name': ingredient.strip(),
-                            'measure': measure.strip() if measure else ''
-                        })
+                    recipes.append(recipe)
                 
-                recipes.append(recipe)
-            
-            return recipes
-        else:
+                return recipes
+            else:
+                return []
+        except Exception as e:
+            print(f"Error fetching recipes: {e}")
             return []
-    except Exception as e:
-        print(f"Error fetching recipes: {e}")
-        return []
+    
+    # Concurrent identical lookups share one HTTP request
+    return recipe_flight.do(('recipes', url, num_meals), fetch)
+
+# Recipe measure units: unit -> (canonical unit, factor to convert into it)
+MEASURE_UNITS = {
+    'g': ('g', 1), 'gram': ('g', 1), 'gramme': ('g', 1), 'kg': ('g', 1000), 'kilogram': ('g', 1000),
+    'mg': ('g', 0.001), 'oz': ('g', 28.3495), 'ounce': ('g', 28.3495), 'lb': ('g', 453.592),
+    'lbs': ('g', 453.592), 'pound': ('g', 453.592),
+    'ml': ('ml', 1), 'millilitre': ('ml', 1), 'milliliter': ('ml', 1), 'cl': ('ml', 10), 'dl': ('ml', 100),
+    'l': ('ml', 1000), 'litre': ('ml', 1000), 'liter': ('ml', 1000), 'tsp': ('ml', 4.92892),
+    'teaspoon': ('ml', 4.92892), 'tbsp': ('ml', 14.7868), 'tbs': ('ml', 14.7868), 'tblsp': ('ml', 14.7868),
+    'tablespoon': ('ml', 14.7868), 'fl oz': ('ml', 29.5735), 'cup': ('ml', 236.588), 'pint': ('ml', 473.176),
+    'pt': ('ml', 473.176), 'quart': ('ml', 946.353), 'qt': ('ml', 946.353), 'gallon': ('ml', 3785.41),
+    'can': ('tin', 1), 'package': ('packet', 1), 'pack': ('packet', 1)
+}
+
+# Units that count things rather than measure them; each is its own canonical unit
+COUNT_UNITS = {
+    'clove', 'tin', 'packet', 'piece', 'slice', 'bunch', 'handful', 'pinch', 'dash', 'sprig', 'stalk', 'stick',
+    'head', 'jar', 'bottle', 'bag', 'box', 'sheet', 'leaf', 'fillet', 'knob', 'sachet', 'cube', 'rasher', 'splash'
+}
+
+# Vulgar fraction characters TheMealDB measures sometimes use
+UNICODE_FRACTIONS = {'½': ' 1/2', '¼': ' 1/4', '¾': ' 3/4', '⅓': ' 1/3', '⅔': ' 2/3', '⅛': ' 1/8'}
+
+MEASURE_NUMBER = r'(\d+\s+\d+/\d+|\d+/\d+|\d*\.\d+|\d+)'
+MEASURE_PATTERN = re.compile(r'^' + MEASURE_NUMBER + r'(?:\s*(?:-|to)\s*' + MEASURE_NUMBER + r')?\s*(.*)$')
+
+# amount in `unit`; unit is None for a plain count ("2" eggs)
+Measure = namedtuple('Measure', ['amount', 'unit'])
+
+def parse_measure_number(text):
+    """
+    Parse "2", "1.5", "1/4" or "1 1/2" into a float
+    """
+    total = 0.0
+    for part in text.split():
+        if '/' in part:
+            numerator, denominator = part.split('/')
+            total += float(numerator) / float(denominator) if float(denominator) else 0.0
+        else:
+            total += float(part)
+    return total
+
+def measure_unit(words):
+    """
+    Canonical unit and conversion factor for the words following a measure's amount,
+    or (None, 1) when they don't start with a known unit
+    """
+    words = [word.strip('.,()') for word in words]
+    # Size words may come between the amount and the unit ("1 large tin")
+    while words and words[0] in INGREDIENT_MODIFIERS:
+        words = words[1:]
+    if not words:
+        return None, 1
+    if len(words) > 1 and f"{words[0]} {words[1]}" in MEASURE_UNITS:
+        return MEASURE_UNITS[f"{words[0]} {words[1]}"]
+    for unit in (words[0], singularize_word(words[0])):
+        if unit in MEASURE_UNITS:
+            return MEASURE_UNITS[unit]
+        if unit in COUNT_UNITS:
+            return unit, 1
+    return None, 1
+
+@lru_cache(maxsize=MEASURE_CACHE_SIZE)
+def parse_measure(measure):
+    """
+    Parse a recipe measure string into a Measure in its canonical unit (grams, millilitres,
+    or a count unit like clove or tin). Returns None when there's no usable amount ("to taste").
+    Ranges ("2-3 cloves") use the upper bound, since that is what the shopping list has to cover.
+    """
+    text = measure.lower().strip()
+    for fraction, replacement in UNICODE_FRACTIONS.items():
+        text = text.replace(fraction, replacement)
+    text = text.strip()
+    
+    match = MEASURE_PATTERN.match(text)
+    if match:
+        amount = parse_measure_number(match.group(2) or match.group(1))
+        rest = match.group(3).split()
+    else:
+        # A bare unit means one of it ("pinch", "handful")
+        amount = 1.0
+        rest = text.split()
+        if not rest or measure_unit(rest)[0] is None:
+            return None
+    
+    unit, factor = measure_unit(rest)
+    return Measure(amount * factor, unit)
+
+def round_amount(amount):
+    """
+    Round a shopping list amount for display, as an int when it is whole
+    """
+    amount = round(amount, 2)
+    return int(amount) if amount == int(amount) else amount
+
+def stock_measure(stock):
+    """
+    Pantry stock as a Measure: plain numbers are counts, strings like "500 g" are parsed
+    """
+    if isinstance(stock, str):
+        return parse_measure(stock)
+    return Measure(stock, None)
+
+def remaining_after_stock(needed, unit, stock):
+    """
+    Use pantry stock (a Measure, or None) for a need in `unit`, returning what is still needed
+    and what stock is left. Stock in the same unit is subtracted; otherwise any stock covers
+    the need, since pantry counts don't record item sizes (one onion vs "200 g" of onion).
+    """
+    if stock is None:
+        return needed, stock
+    if stock.unit == unit:
+        used = min(needed, max(stock.amount, 0))
+        return needed - used, Measure(stock.amount - used, stock.unit)
+    return (0 if stock.amount > 0 else needed), stock
 
-def create_shopping_list(meal_plan, pantry):
+def create_shopping_list(meal_plan, pantry, pantry_version=None):
     """
-    Compare meal plan ingredients with pantry to create shopping list
+    Compare meal plan ingredients with pantry to create shopping list. Ingredients are
+    grouped by normalized name and measured amounts summed per canonical unit across recipes;
+    an ingredient without a usable measure counts once per recipe that uses it. Each pantry
+    item's stock is used up across the needs it supplies rather than counted for each.
+    pantry_version, when known, keys the pantry index cache.
     """
     shopping_list = []
     required_ingredients = {}
@@ -351,21 +2476,29 @@ def create_shopping_list(meal_plan, pantry):
     # Aggregate all ingredients from meal plan
     for recipe in meal_plan:
         for ingredient in recipe['ingredients']:
-            name = ingredient['name'].lower()
-            if name in required_ingredients:
-                required_ingredients[name] += 1
-            else:
-                required_ingredients[name] = 1
+            name = normalize_ingredient_name(ingredient['name'])
+            measure = parse_measure(ingredient.get('measure') or '')
+            if measure is None:
+                measure = Measure(1, None)
+            key = (name, measure.unit)
+            required_ingredients[key] = required_ingredients.get(key, 0) + measure.amount
     
     # Check against pantry
-    for ingredient, needed_quantity in required_ingredients.items():
-        pantry_quantity = pantry.get(ingredient, 0)
+    index = get_pantry_index(pantry, pantry_version)
+    stock_left = {}
+    for (ingredient, unit), needed_quantity in required_ingredients.items():
+        pantry_item = find_pantry_item(ingredient, pantry, index)
+        remaining = needed_quantity
+        if pantry_item is not None:
+            if pantry_item not in stock_left:
+                stock_left[pantry_item] = stock_measure(pantry[pantry_item])
+            remaining, stock_left[pantry_item] = remaining_after_stock(needed_quantity, unit, stock_left[pantry_item])
         
-        if pantry_quantity < needed_quantity:
-            shopping_list.append({
-                'name': ingredient,
-                'needed': needed_quantity - pantry_quantity
-            })
+        if remaining > 0:
+            item = {'name': ingredient, 'needed': round_amount(remaining)}
+            if unit:
+                item['unit'] = unit
+            shopping_list.append(item)
     
     return shopping_list
 
@@ -378,36 +2511,40 @@ def search_kroger_products(product_name, zip_code=None):
         'Content-Type': 'application/json'
     }
     
-    # Find location first if zip_code is provided
-    location_id = None
-    if zip_code:
-        location_id = find_kroger_location(zip_code)
-    
-    # Search for products
-    params = {
-        'filter.term': product_name,
-        'filter.limit': 5
-    }
-    
-    if location_id:
-        params['filter.locationId'] = location_id
-    
-    try:
-        response = requests.get(
-            'https://api.kroger.com/v1/products',
-            headers=headers,
-            params=params
-        )
+    def search():
+        # Find location first if zip_code is provided
+        location_id = None
+        if zip_code:
+            location_id = find_kroger_location(zip_code)
         
-        if response.status_code == 200:
-            data = response.json()
-            return data.get('data', [])
-        else:
-            print(f"Kroger API error: {response.status_code} - {response.text}")
+        # Search for products
+        params = {
+            'filter.term': product_name,
+            'filter.limit': 5
+        }
+        
+        if location_id:
+            params['filter.locationId'] = location_id
+        
+        try:
+            response = requests.get(
+                'https://api.kroger.com/v1/products',
+                headers=headers,
+                params=params
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                return data.get('data', [])
+            else:
+                print(f"Kroger API error: {response.status_code} - {response.text}")
+                return []
+        except Exception as e:
+            print(f"Error searching Kroger products: {e}")
             return []
-    except Exception as e:
-        print(f"Error searching Kroger products: {e}")
-        return []
+    
+    # Concurrent identical searches share one HTTP request
+    return kroger_flight.do(('products', product_name, zip_code), search)
 
 def find_kroger_location(zip_code):
     """
@@ -479,15 +2616,86 @@ def add_items_to_kroger_cart(product_ids):
         print(f"Error adding items to Kroger cart: {e}")
         return False, f"Error adding items to cart: {str(e)}"
 
+def estimate_tokens(text):
+    """
+    Rough token count for prompt budgeting (about four characters per token)
+    """
+    return max(1, (len(text) + 3) // 4)
+
+# Estimated sizes of the recipe prompts sent to the LLM
+recipe_prompt_stats = {'count': 0, 'total_tokens': 0, 'max_tokens': 0, 'last_tokens': 0}
+recipe_prompt_lock = threading.Lock()
+
+def record_recipe_prompt_tokens(tokens):
+    with recipe_prompt_lock:
+        recipe_prompt_stats['count'] += 1
+        recipe_prompt_stats['total_tokens'] += tokens
+        recipe_prompt_stats['max_tokens'] = max(recipe_prompt_stats['max_tokens'], tokens)
+        recipe_prompt_stats['last_tokens'] = tokens
+
+def rank_pantry_items(pantry_items, cuisine=None):
+    """
+    Order pantry items by relevance to a meal plan: cuisine match first, then a blend of
+    quantity and recency. Recency is the item's position in the pantry (newer items come later).
+    """
+    cuisine_ingredients = CUISINE_INGREDIENTS.get(cuisine, set())
+    items = list(pantry_items.items())
+    numeric_quantities = [quantity for _, quantity in items if isinstance(quantity, (int, float))]
+    max_quantity = max(numeric_quantities, default=0)
+    
+    def score(position, item, quantity):
+        cuisine_score = 0.0
+        if cuisine_ingredients:
+            normalized = normalize_ingredient_name(item)
+            if normalized in cuisine_ingredients or any(word in cuisine_ingredients for word in normalized.split()):
+                cuisine_score = 1.0
+        quantity_score = 0.0
+        if isinstance(quantity, (int, float)) and quantity > 0 and max_quantity > 0:
+            quantity_score = math.log1p(quantity) / math.log1p(max_quantity)
+        recency_score = position / (len(items) - 1) if len(items) > 1 else 1.0
+        return 3 * cuisine_score + quantity_score + recency_score
+    
+    ranked = sorted(
+        ((score(position, item, quantity), position, item, quantity) for position, (item, quantity) in enumerate(items)),
+        key=lambda entry: (-entry[0], entry[1])
+    )
+    return [(item, quantity) for _, _, item, quantity in ranked]
+
+def build_pantry_context(pantry_items, cuisine=None, token_budget=None):
+    """
+    Render the most relevant pantry items for the recipe prompt within a token budget
+    """
+    if not pantry_items:
+        return "empty pantry"
+    if token_budget is None:
+        token_budget = PANTRY_PROMPT_TOKEN_BUDGET
+    
+    ranked = rank_pantry_items(pantry_items, cuisine)
+    entries = []
+    used_tokens = 0
+    for item, quantity in ranked:
+        entry = f"{item} ({quantity})"
+        entry_tokens = estimate_tokens(entry + ", ")
+        if entries and used_tokens + entry_tokens > token_budget:
+            break
+        entries.append(entry)
+        used_tokens += entry_tokens
+    
+    pantry_text = ", ".join(entries)
+    omitted = len(ranked) - len(entries)
+    if omitted:
+        pantry_text += f" (plus {omitted} less relevant items)"
+    return pantry_text
+
 def get_recipe_selection_prompt(pantry_items, cuisine=None):
     """
     Return the prompt template for LLM-powered recipe creation based on pantry
     """
-    pantry_text = ", ".join([f"{item} ({quantity})" for item, quantity in pantry_items.items()]) if pantry_items else "empty pantry"
+    pantry_text = build_pantry_context(pantry_items, cuisine)
     
     cuisine_filter = f" Focus on {cuisine} cuisine." if cuisine else ""
     
-    return f"""You are a creative chef and recipe creator. Based on the user's pantry ingredients, CREATE 3 original recipes they can make.
+    prompt = f"""You are a creative chef and recipe creator. Based on the user's pantry ingredients, CREATE 3 original recipes they can make.
 
 User's pantry: {pantry_text}
 {cuisine_filter}
@@ -532,6 +2740,9 @@ IMPORTANT:
 - Include specific cooking techniques and timing in the instructions
 
 User message: "I want to cook something with what I have" """
+    
+    record_recipe_prompt_tokens(estimate_tokens(prompt))
+    return prompt
 
 def create_recipes_with_llm(pantry_items, cuisine=None):
     """
@@ -554,7 +2765,7 @@ def create_recipes_with_llm(pantry_items, cuisine=None):
     prompt = get_recipe_selection_prompt(pantry_items, cuisine)
     messages = [{"role": "user", "content": prompt}]
     
-    response, error = call_openai_with_fallback(messages, temperature=0.7, max_tokens=1000)
+    response, error = call_openai_with_fallback(messages, temperature=0.7, max_tokens=1000, cache_class='meal_plan')
     
     if response:
         try:
@@ -652,19 +2863,217 @@ def create_fallback_recipes(pantry_items, cuisine=None):
     
     return recipes[:3]  # Return max 3 recipes
 
-@app.route('/chat-with-agent', methods=['POST'])
-def chat_with_agent():
-    data = request.json
-    message = data.get('message', '')
+class RecipeStreamParser:
+    """
+    Incrementally parse a streamed {"recipes": [...]} response, returning each
+    recipe object as soon as its closing brace arrives
+    """
+    def __init__(self):
+        self.buffer = ''
+        self.position = 0
+        self.containers = []
+        self.in_string = False
+        self.escaped = False
+        self.recipe_start = None
     
-    state = get_session_state()
+    def feed(self, fragment):
+        self.buffer += fragment
+        recipes = []
+        
+        while self.position < len(self.buffer):
+            char = self.buffer[self.position]
+            
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                # Recipe objects live directly inside the top-level object's array
+                if char == '{' and self.containers == ['{', '[']:
+                    self.recipe_start = self.position
+                self.containers.append(char)
+            elif char in '}]' and self.containers:
+                self.containers.pop()
+                if char == '}' and self.containers == ['{', '['] and self.recipe_start is not None:
+                    try:
+                        recipe = json.loads(self.buffer[self.recipe_start:self.position + 1])
+                        if isinstance(recipe, dict):
+                            recipes.append(recipe)
+                    except json.JSONDecodeError as e:
+                        logger.warning(f"Skipping malformed streamed recipe: {e}")
+                    self.recipe_start = None
+            
+            self.position += 1
+        
+        return recipes
+
+def detect_cuisine(message):
+    """
+    Extract a supported cuisine preference from the user's message
+    """
+    if 'italian' in message.lower():
+        return 'Italian'
+    elif 'mexican' in message.lower():
+        return 'Mexican'
+    elif 'chinese' in message.lower():
+        return 'Chinese'
+    return None
+
+def shopping_list_from_recipes(recipes):
+    """
+    Build a shopping list from the ingredients the recipes mark as missing
+    """
+    shopping_list = []
+    for recipe in recipes:
+        for ingredient in recipe['ingredients']:
+            if not ingredient['has']:
+                # Check if we already have this item in shopping list
+                existing_item = next((item for item in shopping_list if item['name'] == ingredient['name']), None)
+                if existing_item:
+                    existing_item['needed'] += 1
+                else:
+                    shopping_list.append({
+                        'name': ingredient['name'],
+                        'needed': 1
+                    })
+    return shopping_list
+
+def stream_recipes_with_llm(pantry_items, cuisine=None):
+    """
+    Streaming counterpart of create_recipes_with_llm: yields recipes one at a time
+    as the LLM finishes writing each of them, with the same fallbacks
+    """
+    if not pantry_items:
+        yield from create_recipes_with_llm(pantry_items, cuisine)
+        return
     
-    # Load pantry from file
-    state.pantry = load_pantry()
+    prompt = get_recipe_selection_prompt(pantry_items, cuisine)
+    messages = [{"role": "user", "content": prompt}]
+    
+    parser = RecipeStreamParser()
+    streamed = 0
+    try:
+        for fragment in stream_openai_with_fallback(messages, max_tokens=1000, cache_class='meal_plan'):
+            for recipe in parser.feed(fragment):
+                if isinstance(recipe.get('ingredients'), list):
+                    streamed += 1
+                    yield recipe
+    except Exception as e:
+        logger.warning(f"LLM recipe stream failed after {streamed} recipes: {e}")
+    
+    if streamed:
+        logger.info(f"LLM streamed {streamed} original recipes based on pantry")
+        return
+    
+    logger.warning("LLM streamed no recipes, falling back to simple recipes")
+    yield from create_fallback_recipes(pantry_items, cuisine)
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def classify_message(message, deadline=None):
+    """
+    Recognize intent (and pantry entities, when fused into the same call)
+    """
+    if FUSED_INTENT_EXTRACTION:
+        return classify_and_extract(message, deadline=deadline)
+    return recognize_intent(message, deadline=deadline), None
+
+def classify_messages_with_llm(messages, chunk_size=None):
+    """
+    Classify many messages and extract their pantry entities with a few concurrent LLM calls
+    of chunk_size messages each. Returns one (intent, entities) pair per message; entities is
+    None unless the LLM returned a valid entity list for an update_pantry message, and a
+    message the LLM didn't answer is classified by keyword matching.
+    """
+    if chunk_size is None:
+        chunk_size = PANTRY_BATCH_CHUNK_SIZE
+    chunks = [messages[start:start + chunk_size] for start in range(0, len(messages), chunk_size)]
+    
+    calls = []
+    for chunk in chunks:
+        numbered = "\n".join(f"{number}. {message}" for number, message in enumerate(chunk, 1))
+        prompt = get_batch_intent_and_entity_prompt().format(messages=numbered)
+        calls.append({
+            'messages': [{"role": "user", "content": prompt}],
+            'temperature': 0.1,
+            'max_tokens': min(4000, 80 * len(chunk) + 100),
+            'cache_class': 'entities_batch'
+        })
+    
+    results = []
+    for chunk, (response, error) in zip(chunks, call_openai_many(calls)):
+        by_number = {}
+        if response:
+            try:
+                parsed = json.loads(response)
+                if isinstance(parsed, dict):
+                    by_number = parsed
+                else:
+                    logger.warning("LLM batch classification is not an object, falling back to keyword matching")
+            except json.JSONDecodeError as e:
+                logger.warning(f"LLM returned invalid JSON for batch classification: {e}, falling back to keyword matching")
+        else:
+            logger.warning(f"LLM batch classification failed: {error}, falling back to keyword matching")
+        
+        for number, message in enumerate(chunk, 1):
+            result = by_number.get(str(number))
+            intent = validate_intent(result.get('intent')) if isinstance(result, dict) else None
+            if not intent:
+                record_intent_tier('keyword')
+                results.append((keyword_intent(message), None))
+                continue
+            
+            record_intent_tier('llm')
+            remember_intent(message_fingerprint(message), intent)
+            entities = validate_pantry_entities(result.get('entities')) if intent == 'update_pantry' else None
+            results.append((intent, entities or None))
+    
+    return results
+
+def classify_messages(messages):
+    """
+    Classify a batch of messages in one pass. Distinct messages the intent cache and local
+    classifier can't answer are classified together in batched LLM prompts, then the
+    update_pantry messages still missing entities are extracted together, so a batch takes
+    at most two rounds of LLM calls however many messages it holds. Results come back in
+    message order.
+    """
+    classified = {}
+    pending = []
+    for message in dict.fromkeys(messages):
+        fingerprint = message_fingerprint(message)
+        intent = lookup_cached_intent(fingerprint) or classify_intent_locally(message)
+        if intent:
+            remember_intent(fingerprint, intent)
+            classified[message] = (intent, None)
+        else:
+            pending.append(message)
     
-    # Recognize intent
-    intent = recognize_intent(message)
+    if pending:
+        classified.update(zip(pending, classify_messages_with_llm(pending)))
     
+    needs_entities = [
+        message for message, (intent, entities) in classified.items()
+        if intent == 'update_pantry' and entities is None
+    ]
+    if needs_entities:
+        for message, (entities, _) in zip(needs_entities, extract_pantry_entities_batch(needs_entities)):
+            classified[message] = ('update_pantry', entities)
+    
+    return [classified[message] for message in messages]
+
+def respond_to_message(state, message, intent, entities, deferred_entities=None):
+    """
+    Act on one classified chat message and return the response. Pantry updates are written
+    straight away, or applied to state.pantry only and collected in deferred_entities when
+    the caller writes them later in one go.
+    """
     response = {'type': 'text', 'message': ''}
     
     if intent == 'check_pantry':
@@ -675,38 +3084,22 @@ def chat_with_agent():
             response['message'] = "Your pantry is empty. You can add items by telling me what you bought or have."
     
     elif intent == 'update_pantry':
-        entities = extract_pantry_entities(message)
+        if entities is None:
+            entities = extract_pantry_entities(message)
         
         if entities:
-            for entity in entities:
-                item = entity['item']
-                quantity = entity['quantity']
-                action = entity['action']
-                
-                if action == 'add':
-                    state.pantry[item] = state.pantry.get(item, 0) + quantity
-                elif action == 'remove':
-                    if item in state.pantry:
-                        if quantity == 0 or state.pantry[item] <= quantity:
-                            # Remove the item completely (spoiled, expired, used up, etc.)
-                            del state.pantry[item]
-                        else:
-                            # Subtract the quantity, but don't go below zero
-                            state.pantry[item] = max(0, state.pantry[item] - quantity)
-            save_pantry(state.pantry)
+            if deferred_entities is None:
+                state.pantry = update_pantry_entities(entities)
+            else:
+                apply_pantry_entities(state.pantry, entities)
+                deferred_entities.extend(entities)
             response['message'] = "I've updated your pantry!"
         else:
             response['message'] = "I couldn't understand what items you want to update. Please try again."
     
     elif intent == 'request_meal_plan':
         # Extract cuisine or dietary preferences
-        cuisine = None
-        if 'italian' in message.lower():
-            cuisine = 'Italian'
-        elif 'mexican' in message.lower():
-            cuisine = 'Mexican'
-        elif 'chinese' in message.lower():
-            cuisine = 'Chinese'
+        cuisine = detect_cuisine(message)
         
         # Use LLM to select recipes based on pantry contents
         recipes = create_recipes_with_llm(state.pantry, cuisine)
@@ -715,19 +3108,7 @@ def chat_with_agent():
             state.current_meal_plan = recipes
             
             # Create shopping list from missing ingredients
-            shopping_list = []
-            for recipe in recipes:
-                for ingredient in recipe['ingredients']:
-                    if not ingredient['has']:
-                        # Check if we already have this item in shopping list
-                        existing_item = next((item for item in shopping_list if item['name'] == ingredient['name']), None)
-                        if existing_item:
-                            existing_item['needed'] += 1
-                        else:
-                            shopping_list.append({
-                                'name': ingredient['name'],
-                                'needed': 1
-                            })
+            shopping_list = shopping_list_from_recipes(recipes)
             
             state.current_shopping_list = shopping_list
             
@@ -744,8 +3125,7 @@ def chat_with_agent():
         
         # TEMPORARY b/c API isn't working:
         response['message'] = "Added to your Kroger Cart!"
-        save_session_state(state)
-        return jsonify(response)
+        return response
         
         
         if not state.user_preferences.get('zip_code'):
@@ -759,8 +3139,7 @@ def chat_with_agent():
                 # Continue with cart logic below
             else:
                 response['message'] = "I need your zip code to find a nearby Kroger store. What is your zip code?"
-                save_session_state(state)
-                return jsonify(response)
+                return response
         
         if not state.current_shopping_list:
             response['message'] = "You don't have any items in your shopping list. Please create a meal plan first."
@@ -803,10 +3182,95 @@ def chat_with_agent():
     else:
         response['message'] = "I'm not sure what you want to do. You can ask me to check your pantry, update your pantry, create a meal plan, or add items to your Kroger cart."
     
+    return response
+
+@app.route('/chat-with-agent', methods=['POST'])
+def chat_with_agent():
+    data = request.json
+    message = data.get('message', '')
+    
+    state = get_session_state()
+    
+    # Load pantry from file
+    state.pantry = load_pantry()
+    
+    intent, entities = classify_message(message)
+    response = respond_to_message(state, message, intent, entities)
+    
     save_session_state(state)
     
     return jsonify(response)
 
+@app.route('/chat-with-agent/batch', methods=['POST'])
+def chat_with_agent_batch():
+    """
+    Process an ordered list of messages for one session in a single request. All messages
+    are classified up front, each is answered in order against the evolving session state,
+    and their pantry updates are written once at the end.
+    """
+    data = request.json or {}
+    messages = data.get('messages')
+    if not isinstance(messages, list) or not all(isinstance(message, str) for message in messages):
+        return jsonify({'error': "Expected 'messages' to be a list of strings"}), 400
+    if not messages:
+        return jsonify({'error': 'No messages to process'}), 400
+    if len(messages) > CHAT_BATCH_MAX_MESSAGES:
+        return jsonify({'error': f'At most {CHAT_BATCH_MAX_MESSAGES} messages per batch'}), 400
+    
+    state = get_session_state()
+    state.pantry = load_pantry()
+    
+    deferred_entities = []
+    results = []
+    for message, (intent, entities) in zip(messages, classify_messages(messages)):
+        response = respond_to_message(state, message, intent, entities, deferred_entities)
+        results.append({'message': message, 'intent': intent, 'response': response})
+    
+    if deferred_entities:
+        state.pantry = update_pantry_entities(deferred_entities)
+    save_session_state(state)
+    
+    return jsonify({'results': results})
+
+
+@app.route('/chat-with-agent/stream', methods=['POST'])
+def chat_with_agent_stream():
+    """
+    Server-Sent Events variant of the meal-plan path: one `recipe` event per recipe
+    as soon as it is complete, then `shopping_list`, then `done`
+    """
+    data = request.json or {}
+    message = data.get('message', '')
+    
+    state = get_session_state()
+    # The cookie goes out with the response headers, so the session id must exist before streaming
+    session_id()
+    pantry = load_pantry()
+    cuisine = detect_cuisine(message)
+    
+    def generate():
+        recipes = []
+        for recipe in stream_recipes_with_llm(pantry, cuisine):
+            recipes.append(recipe)
+            yield format_sse('recipe', recipe)
+        
+        shopping_list = shopping_list_from_recipes(recipes)
+        state.pantry = pantry
+        state.current_meal_plan = recipes
+        state.current_shopping_list = shopping_list
+        save_session_state(state)
+        
+        yield format_sse('shopping_list', shopping_list)
+        yield format_sse('done', {
+            'message': f"Here's your personalized meal plan with {len(recipes)} recipes based on your pantry!"
+        })
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/set-zipcode', methods=['POST'])
 def set_zipcode():
     data = request.json
@@ -818,5 +3282,175 @@ def set_zipcode():
     
     return jsonify({'message': f'Zip code set to {zipcode}'})
 
+@app.route('/pantry/export', methods=['GET'])
+def export_pantry():
+    """
+    Stream the pantry as NDJSON, one {"item", "quantity"} object per line
+    """
+    if pantry_store is not None:
+        items = pantry_store.iter_items(current_household_id())
+    else:
+        items = iter(load_pantry().items())
+    
+    def generate():
+        for item, quantity in items:
+            yield json.dumps({'item': item, 'quantity': quantity}) + '\n'
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename=pantry.ndjson'}
+    )
+
+@app.route('/pantry/import', methods=['POST'])
+def import_pantry():
+    """
+    Read NDJSON {"item", "quantity"} records from the request body line by line and set
+    those quantities in the pantry under canonical item names, writing every
+    PANTRY_IMPORT_BATCH_SIZE records at once
+    """
+    imported = 0
+    removed = 0
+    batches = 0
+    errors = []
+    batch = {}
+    
+    def flush():
+        nonlocal batches
+        if batch:
+            set_pantry_quantities(batch)
+            batches += 1
+            batch.clear()
+    
+    for line_number, line in enumerate(request.stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item, quantity = parse_pantry_record(line)
+        except ValueError as e:
+            if len(errors) < PANTRY_IMPORT_MAX_ERRORS:
+                errors.append({'line': line_number, 'error': str(e)})
+            continue
+        
+        # Store under the canonical name chat updates use, replacing any copy kept under the raw name
+        canonical = lemmatize_ingredient(item)
+        if canonical != item:
+            batch[item] = None
+        batch[canonical] = quantity
+        if quantity is None:
+            removed += 1
+        else:
+            imported += 1
+        if len(batch) >= PANTRY_IMPORT_BATCH_SIZE:
+            flush()
+    flush()
+    
+    return jsonify({
+        'imported': imported,
+        'removed': removed,
+        'batches': batches,
+        'errors': errors,
+        'message': f"Imported {imported} pantry items."
+    })
+
+# Pantries as last sent to clients, keyed by (household, version), for computing deltas
+pantry_snapshots = LRUCache(PANTRY_DELTA_HISTORY)
+
+@app.route('/pantry', methods=['GET'])
+def get_pantry():
+    """
+    Return the pantry with its version as the ETag. A matching If-None-Match gets a 304
+    without reading the pantry, and ?since=<version> returns only the items changed since.
+    """
+    household_id = current_household_id() if pantry_store is not None else 'default'
+    if request.if_none_match:
+        current_version = pantry_version()
+        if request.if_none_match.contains(current_version):
+            response = Response(status=304)
+            response.set_etag(current_version)
+            return response
+    
+    pantry, version = load_pantry_with_version()
+    pantry_snapshots.set((household_id, version), dict(pantry))
+    
+    since = request.args.get('since')
+    previous = pantry_snapshots.get((household_id, since)) if since else None
+    if previous is not None:
+        changes = {item: pantry.get(item) for item in set(previous) | set(pantry)
+                   if previous.get(item) != pantry.get(item)}
+        response = jsonify({'version': version, 'since': since, 'full': False, 'changes': changes})
+    else:
+        # Unknown or evicted version: the client has to replace its copy
+        response = jsonify({'version': version, 'full': True, 'pantry': pantry})
+    response.set_etag(version)
+    return response
+
+@app.route('/pantry/batch-update', methods=['POST'])
+def batch_update_pantry():
+    """
+    Apply a pasted grocery list or receipt to the pantry: entities for all lines are
+    extracted in a few grouped LLM calls and the pantry is written once
+    """
+    data = request.json or {}
+    lines = data.get('lines')
+    if lines is None:
+        text = data.get('text', '')
+        if not isinstance(text, str):
+            return jsonify({'error': "Expected 'text' to be a string"}), 400
+        lines = text.splitlines()
+    if not isinstance(lines, list) or not all(isinstance(line, str) for line in lines):
+        return jsonify({'error': "Expected 'lines' to be a list of strings"}), 400
+    lines = [line.strip() for line in lines if line.strip()]
+    if not lines:
+        return jsonify({'error': 'No lines to process'}), 400
+    
+    state = get_session_state()
+    state.pantry = load_pantry()
+    
+    results = []
+    updated_lines = 0
+    all_entities = []
+    for line, (entities, source) in zip(lines, extract_pantry_entities_batch(lines)):
+        if entities:
+            updated_lines += 1
+            all_entities.extend(entities)
+        results.append({'line': line, 'entities': entities, 'source': source})
+    
+    if updated_lines:
+        state.pantry = update_pantry_entities(all_entities)
+    save_session_state(state)
+    
+    return jsonify({
+        'results': results,
+        'updated_lines': updated_lines,
+        'message': f"I've updated your pantry from {updated_lines} of {len(lines)} lines!"
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify({
+        'llm_cache': llm_cache.stats(),
+        'intent_tiers': {tier: intent_tier_counts[tier] for tier in ('cache', 'local', 'llm', 'keyword')},
+        'intent_cache': intent_cache.stats(),
+        'recipe_prompt_tokens': dict(recipe_prompt_stats),
+        'llm_client': {event: llm_client_stats[event] for event in ('timeouts', 'deadline_exceeded')},
+        'circuit_breaker': openai_breaker.stats(),
+        'pantry_cache': pantry_cache.stats(),
+        'pantry_journal': pantry_journal.stats(),
+        'sessions': session_store.stats(),
+        'state_encoding': state_encoding_metrics(),
+        'ingredient_names': normalize_ingredient_name.cache_info()._asdict(),
+        'ingredient_lemmas': lemmatize_ingredient.cache_info()._asdict(),
+        'measures': parse_measure.cache_info()._asdict(),
+        'pantry_index': pantry_index_cache.stats(),
+        'pantry_updates': {'conflicts': pantry_update_stats['conflicts']},
+        'coalescing': {
+            'llm': llm_flight.stats(),
+            'recipes': recipe_flight.stats(),
+            'kroger_products': kroger_flight.stats()
+        }
+    })
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
\ No newline at end of file
@@ -2,7 +2,47 @@ import pytest
 import os
 import tempfile
 import json
-from app import app, SessionState
+
+# Keep the default on-disk session store out of the real data directory
+os.environ.setdefault('SESSION_DB', os.path.join(tempfile.mkdtemp(), 'sessions.db'))
+
+import app as app_module
+from app import app, SessionState, llm_cache
+
+
+@pytest.fixture(autouse=True)
+def reset_caches():
+    # Module-level caches outlive a single test; start every test cold
+    llm_cache.clear()
+    app_module.intent_cache.clear()
+    app_module.intent_tier_counts.clear()
+    app_module.llm_client_stats.clear()
+    app_module.openai_breaker.reset()
+    app_module.pantry_cache.clear()
+    app_module.pantry_journal.reset()
+    app_module.pantry_update_stats.clear()
+    app_module.pantry_snapshots.clear()
+    app_module.session_store.clear()
+    app_module.state_encoding_stats.clear()
+    app_module.pantry_index_cache.clear()
+    app_module.recipe_prompt_stats.update(count=0, total_tokens=0, max_tokens=0, last_tokens=0)
+    for flight in (app_module.llm_flight, app_module.recipe_flight, app_module.kroger_flight):
+        flight.reset()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def pantry_file(tmp_path, monkeypatch):
+    # Keep pantry writes (and the lock and journal files beside them) out of the repo
+    pantry_file = tmp_path / 'data' / 'pantry.json'
+    monkeypatch.setattr(app_module, 'PANTRY_FILE', str(pantry_file))
+    return pantry_file
+
+
+@pytest.fixture(autouse=True)
+def llm_intent_tier(monkeypatch):
+    # Most tests exercise the LLM and keyword tiers; tests of the local classifier opt back in
+    monkeypatch.setattr(app_module, 'INTENT_CONFIDENCE_THRESHOLD', 1.1)
 
 
 @pytest.fixture
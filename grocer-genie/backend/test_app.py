@@ -1,16 +1,26 @@
 import pytest
 import json
 import os
+import sqlite3
 import tempfile
+import threading
+import time
 from unittest.mock import patch, mock_open, MagicMock
 import responses
 from app import (
     app, SessionState, get_session_state, save_session_state,
     load_pantry, save_pantry, recognize_intent, extract_pantry_entities,
-    fetch_recipes, create_shopping_list, search_kroger_products,
+    fetch_recipes, create_shopping_list, parse_measure, search_kroger_products,
     find_kroger_location, add_items_to_kroger_cart,
-    normalize_ingredient_name, check_ingredient_availability,
-    create_recipes_with_llm, create_fallback_recipes
+    normalize_ingredient_name, singularize_word, lemmatize_ingredient, check_ingredient_availability,
+    create_recipes_with_llm, create_fallback_recipes,
+    RecipeStreamParser, shopping_list_from_recipes, detect_cuisine,
+    rank_pantry_items, build_pantry_context, get_recipe_selection_prompt, estimate_tokens,
+    PANTRY_PROMPT_TOKEN_BUDGET, apply_pantry_entities, extract_pantry_entities_batch, validate_pantry_entities,
+    pantry_cache, pantry_journal, SQLitePantryStore, update_pantry_entities, pantry_update_stats,
+    session_store, SessionStore, STATE_BLOB_MAGIC, dump_state_json, encode_state, decode_state,
+    state_encoding_metrics, load_ingredient_aliases, pantry_index_cache,
+    get_pantry_index
 )
 import flask
 
@@ -58,14 +68,295 @@ class TestPantryFunctions:
         pantry = load_pantry()
         assert pantry == {}
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('os.makedirs')
-    @patch('json.dump')
-    def test_save_pantry(self, mock_json_dump, mock_makedirs, mock_file):
+    def test_save_pantry(self, tmp_path):
+        pantry_file = tmp_path / 'data' / 'pantry.json'
         pantry_data = {'apples': 5}
-        save_pantry(pantry_data)
-        mock_makedirs.assert_called_once()
-        mock_json_dump.assert_called_once_with(pantry_data, mock_file(), indent=2)
+        with patch('app.PANTRY_FILE', str(pantry_file)):
+            save_pantry(pantry_data)
+        assert json.loads(pantry_file.read_text()) == pantry_data
+        assert not os.path.exists(str(pantry_file) + '.tmp')
+    
+    def test_load_pantry_reuses_cached_copy(self, tmp_path):
+        pantry_file = tmp_path / 'pantry.json'
+        pantry_file.write_text('{"apples": 3}')
+        with patch('app.PANTRY_FILE', str(pantry_file)):
+            with patch('app.json.load', wraps=json.load) as mock_load:
+                first = load_pantry()
+                first['apples'] = 99
+                second = load_pantry()
+        
+        assert mock_load.call_count == 1
+        assert second == {'apples': 3}
+        assert pantry_cache.stats() == {'hits': 1, 'reloads': 1}
+    
+    def test_load_pantry_rereads_after_external_change(self, tmp_path):
+        pantry_file = tmp_path / 'pantry.json'
+        pantry_file.write_text('{"apples": 3}')
+        with patch('app.PANTRY_FILE', str(pantry_file)):
+            assert load_pantry() == {'apples': 3}
+            pantry_file.write_text('{"apples": 3, "pears": 1}')
+            stat = os.stat(pantry_file)
+            os.utime(pantry_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+            assert load_pantry() == {'apples': 3, 'pears': 1}
+    
+    def test_save_pantry_updates_cache(self, tmp_path):
+        pantry_file = tmp_path / 'pantry.json'
+        with patch('app.PANTRY_FILE', str(pantry_file)):
+            save_pantry({'eggs': 12})
+            with patch('app.json.load', wraps=json.load) as mock_load:
+                assert load_pantry() == {'eggs': 12}
+        
+        mock_load.assert_not_called()
+    
+    def test_save_pantry_appends_changes_to_journal(self, tmp_path):
+        pantry_file = tmp_path / 'pantry.json'
+        with patch('app.PANTRY_FILE', str(pantry_file)):
+            save_pantry({'eggs': 12, 'milk': 1})
+            save_pantry({'eggs': 10}, ['eggs', 'milk'])
+            snapshot = json.loads(pantry_file.read_text())
+            journal = (tmp_path / 'pantry.json.journal').read_text().splitlines()
+            pantry_cache.clear()
+            reloaded = load_pantry()
+        
+        assert snapshot == {'eggs': 12, 'milk': 1}
+        assert [json.loads(line) for line in journal] == [{'set': {'eggs': 10, 'milk': None}}]
+        assert reloaded == {'eggs': 10}
+    
+    def test_load_pantry_skips_torn_journal_record(self, tmp_path):
+        pantry_file = tmp_path / 'pantry.json'
+        pantry_file.write_text('{"eggs": 12}')
+        (tmp_path / 'pantry.json.journal').write_text('{"set": {"eggs": 6}}\n{"set": {"mi')
+        with patch('app.PANTRY_FILE', str(pantry_file)):
+            assert load_pantry() == {'eggs': 6}
+    
+    def test_append_after_torn_journal_record_survives_reload(self, tmp_path):
+        pantry_file = tmp_path / 'pantry.json'
+        pantry_file.write_text('{"eggs": 12}')
+        journal_file = tmp_path / 'pantry.json.journal'
+        journal_file.write_text('{"set": {"eggs": 6}}\n{"set": {"mil')
+        with patch('app.PANTRY_FILE', str(pantry_file)):
+            update_pantry_entities([{"item": "rice", "quantity": 2, "action": "add"}])
+            pantry_cache.clear()
+            reloaded = load_pantry()
+        
+        assert journal_file.read_text().splitlines() == ['{"set": {"eggs": 6}}', '{"set": {"rice": 2}}']
+        assert reloaded == {'eggs': 6, 'rice': 2}
+    
+    def test_journal_compaction_folds_into_snapshot(self, tmp_path):
+        pantry_file = tmp_path / 'pantry.json'
+        with patch('app.PANTRY_FILE', str(pantry_file)), patch('app.PANTRY_JOURNAL_COMPACT_AFTER', 2):
+            save_pantry({'eggs': 1}, ['eggs'])
+            save_pantry({'eggs': 1, 'rice': 2}, ['rice'])
+            pantry_journal.pending_compaction.result(timeout=5)
+            pantry_cache.clear()
+            reloaded = load_pantry()
+        
+        assert json.loads(pantry_file.read_text()) == {'eggs': 1, 'rice': 2}
+        assert not (tmp_path / 'pantry.json.journal').exists()
+        assert reloaded == {'eggs': 1, 'rice': 2}
+        assert pantry_journal.stats()['compactions'] == 1
+
+
+
+class TestSQLitePantryStore:
+    @pytest.fixture
+    def store(self, tmp_path):
+        return SQLitePantryStore(str(tmp_path / 'pantry.db'))
+    
+    def test_upsert_and_load(self, store):
+        store.upsert('house-1', {'eggs': 12, 'milk': 1})
+        store.upsert('house-1', {'eggs': 6, 'milk': None, 'rice': 2.5})
+        assert store.load('house-1') == {'eggs': 6, 'rice': 2.5}
+        assert store.load('house-2') == {}
+    
+    def test_point_lookup_uses_normalized_name(self, store):
+        store.replace('house-1', {'Eggs': 12, 'whole milk': 1})
+        assert store.get('house-1', 'egg') == {'Eggs': 12}
+        assert store.get('house-1', 'milk') == {'whole milk': 1}
+        assert store.get('house-2', 'egg') == {}
+    
+    def test_range_query(self, store):
+        store.replace('house-1', {'apples': 1, 'bread': 2, 'carrots': 3, 'dates': 4})
+        assert list(store.range('house-1', 'b', 'd')) == ['bread', 'carrots']
+        assert list(store.range('house-1', 'c')) == ['carrots', 'dates']
+    
+    def test_chat_updates_are_per_household(self, store):
+        entities = [{"item": "onion", "quantity": 2, "action": "add"}]
+        with patch('app.pantry_store', store):
+            with patch('app.classify_and_extract', return_value=('update_pantry', entities)):
+                first, second = app.test_client(), app.test_client()
+                first.post('/chat-with-agent', json={'message': 'I bought 2 onions'})
+                first.post('/chat-with-agent', json={'message': 'I bought 2 onions'})
+                second.post('/chat-with-agent', json={'message': 'I bought 2 onions'})
+            with first.session_transaction() as sess:
+                first_household = sess['household_id']
+            with second.session_transaction() as sess:
+                second_household = sess['household_id']
+        
+        assert first_household != second_household
+        assert store.load(first_household) == {'onion': 4}
+        assert store.load(second_household) == {'onion': 2}
+
+
+class TestConcurrentPantryUpdates:
+    ADD_ONE = [{"item": "egg", "quantity": 1, "action": "add"}]
+    
+    def _run_concurrently(self, fn, workers=16):
+        barrier = threading.Barrier(workers)
+        
+        def run():
+            barrier.wait()
+            fn()
+        
+        threads = [threading.Thread(target=run) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    
+    def test_file_backend_keeps_every_update(self):
+        self._run_concurrently(lambda: update_pantry_entities(self.ADD_ONE))
+        pantry_cache.clear()
+        assert load_pantry() == {'egg': 16}
+    
+    def test_sqlite_backend_keeps_every_update(self, tmp_path):
+        store = SQLitePantryStore(str(tmp_path / 'pantry.db'))
+        with patch('app.pantry_store', store):
+            self._run_concurrently(lambda: update_pantry_entities(self.ADD_ONE))
+        assert store.load('default') == {'egg': 16}
+        assert store.version('default') == 16
+    
+    def test_sqlite_mutate_retries_after_conflict(self, tmp_path):
+        store = SQLitePantryStore(str(tmp_path / 'pantry.db'))
+        store.upsert('house-1', {'egg': 6})
+        calls = []
+        
+        def update(pantry):
+            if not calls:
+                # Another worker commits between this read and the write
+                store.upsert('house-1', {'milk': 1})
+            calls.append(dict(pantry))
+            pantry['egg'] -= 2
+        
+        assert store.mutate('house-1', update) == {'egg': 4, 'milk': 1}
+        assert calls == [{'egg': 6}, {'egg': 6, 'milk': 1}]
+        assert pantry_update_stats['conflicts'] == 1
+        assert store.version('house-1') == 3
+
+
+class TestPantryEndpoint:
+    def test_returns_pantry_with_etag(self, client):
+        save_pantry({'eggs': 12})
+        response = client.get('/pantry')
+        data = response.get_json()
+        
+        assert response.status_code == 200
+        assert data['full'] is True
+        assert data['pantry'] == {'eggs': 12}
+        assert response.headers['ETag'] == f'"{data["version"]}"'
+    
+    def test_if_none_match_returns_304(self, client):
+        save_pantry({'eggs': 12})
+        etag = client.get('/pantry').headers['ETag']
+        
+        with patch('app.load_pantry') as mock_load:
+            response = client.get('/pantry', headers={'If-None-Match': etag})
+        
+        assert response.status_code == 304
+        assert response.get_data() == b''
+        mock_load.assert_not_called()
+        
+        save_pantry({'eggs': 6}, ['eggs'])
+        assert client.get('/pantry', headers={'If-None-Match': etag}).status_code == 200
+    
+    def test_since_returns_only_changes(self, client):
+        save_pantry({'eggs': 12, 'milk': 1, 'rice': 2})
+        version = client.get('/pantry').get_json()['version']
+        save_pantry({'eggs': 10, 'rice': 2, 'bread': 1}, ['eggs', 'milk', 'bread'])
+        
+        data = client.get(f'/pantry?since={version}').get_json()
+        
+        assert data['full'] is False
+        assert data['since'] == version
+        assert data['changes'] == {'eggs': 10, 'milk': None, 'bread': 1}
+        assert data['version'] != version
+    
+    def test_unknown_since_falls_back_to_full_pantry(self, client):
+        save_pantry({'eggs': 12})
+        data = client.get('/pantry?since=stale').get_json()
+        assert data['full'] is True
+        assert data['pantry'] == {'eggs': 12}
+    
+    def test_sqlite_backend_uses_household_version(self, client, tmp_path):
+        store = SQLitePantryStore(str(tmp_path / 'pantry.db'))
+        with patch('app.pantry_store', store):
+            empty = client.get('/pantry')
+            with client.session_transaction() as sess:
+                household_id = sess['household_id']
+            store.upsert(household_id, {'eggs': 12})
+            first = client.get('/pantry')
+            store.upsert(household_id, {'eggs': 6})
+            second = client.get(f'/pantry?since={first.get_json()["version"]}')
+        
+        assert empty.get_json() == {'version': '0', 'full': True, 'pantry': {}}
+        assert first.get_json() == {'version': '1', 'full': True, 'pantry': {'eggs': 12}}
+        assert second.get_json()['changes'] == {'eggs': 6}
+        assert second.headers['ETag'] == '"2"'
+
+
+class TestPantryImportExport:
+    def _import(self, client, lines):
+        return client.post('/pantry/import', data='\n'.join(lines), content_type='application/x-ndjson')
+    
+    def test_export_streams_ndjson(self, client):
+        save_pantry({'eggs': 12, 'rice': 2.5})
+        response = client.get('/pantry/export')
+        
+        assert response.mimetype == 'application/x-ndjson'
+        lines = response.get_data(as_text=True).splitlines()
+        assert [json.loads(line) for line in lines] == [
+            {'item': 'eggs', 'quantity': 12}, {'item': 'rice', 'quantity': 2.5}
+        ]
+    
+    def test_import_applies_records_in_batches(self, client):
+        save_pantry({'eggs': 12, 'milk': 1})
+        lines = [json.dumps({'item': f'item {i}', 'quantity': i + 1}) for i in range(5)]
+        lines += ['{"item": "milk", "quantity": 0}', '', '{"item": "eggs", "quantity": 6}']
+        
+        with patch('app.PANTRY_IMPORT_BATCH_SIZE', 3):
+            data = self._import(client, lines).get_json()
+        
+        assert data['imported'] == 6
+        assert data['removed'] == 1
+        assert data['batches'] == 3
+        assert data['errors'] == []
+        pantry = load_pantry()
+        assert pantry['egg'] == 6 and pantry['item 4'] == 5
+        assert 'eggs' not in pantry and 'milk' not in pantry
+    
+    def test_import_uses_canonical_item_names(self, client):
+        save_pantry({'rice': 1})
+        self._import(client, ['{"item": "Rice", "quantity": 3}', '{"item": "Fresh Tomatoes", "quantity": 2}'])
+        
+        assert load_pantry() == {'rice': 3, 'tomato': 2}
+    
+    def test_import_reports_bad_lines(self, client):
+        data = self._import(client, [
+            '{"item": "eggs", "quantity": 2}', 'not json', '{"quantity": 2}', '{"item": "rice", "quantity": -1}'
+        ]).get_json()
+        
+        assert data['imported'] == 1
+        assert [error['line'] for error in data['errors']] == [2, 3, 4]
+        assert load_pantry() == {'egg': 2}
+    
+    def test_round_trip_through_sqlite_store(self, client, tmp_path):
+        store = SQLitePantryStore(str(tmp_path / 'pantry.db'))
+        lines = [json.dumps({'item': f'item {i}', 'quantity': i}) for i in range(1, 1201)]
+        with patch('app.pantry_store', store):
+            assert self._import(client, lines).get_json()['batches'] == 3
+            exported = client.get('/pantry/export').get_data(as_text=True).splitlines()
+        
+        assert exported == lines
 
 
 class TestIntentRecognition:
@@ -178,6 +469,74 @@ class TestRecipeFunctions:
         cheese_item = next((item for item in shopping_list if item['name'] == 'cheese'), None)
         assert cheese_item is not None
         assert cheese_item['needed'] == 1
+    
+    def test_parse_measure(self):
+        assert parse_measure('3 cloves') == (3, 'clove')
+        assert parse_measure('1 tin') == parse_measure('1 can') == (1, 'tin')
+        assert parse_measure('1/4 cup').unit == 'ml'
+        assert parse_measure('1/4 cup').amount == pytest.approx(59.147)
+        assert parse_measure('1 1/2 tsp').amount == pytest.approx(7.39338)
+        assert parse_measure('½ cup').amount == pytest.approx(118.294)
+        assert parse_measure('1.5kg') == (1500, 'g')
+        assert parse_measure('2 lbs').amount == pytest.approx(907.184)
+        assert parse_measure('2-3 cloves') == (3, 'clove')
+        assert parse_measure('2 large') == (2, None)
+        assert parse_measure('Pinch') == (1, 'pinch')
+        assert parse_measure('to taste') is None
+        assert parse_measure('') is None
+        
+        hits = parse_measure.cache_info().hits
+        parse_measure('3 cloves')
+        assert parse_measure.cache_info().hits == hits + 1
+    
+    def test_create_shopping_list_sums_measures(self):
+        meal_plan = [
+            {'ingredients': [
+                {'name': 'Milk', 'measure': '1 cup'},
+                {'name': 'garlic', 'measure': '3 cloves'},
+                {'name': 'eggs', 'measure': '2'}
+            ]},
+            {'ingredients': [
+                {'name': 'milk', 'measure': '1/2 cup'},
+                {'name': 'garlic', 'measure': '2 cloves'},
+                {'name': 'eggs', 'measure': '3'},
+                {'name': 'salt', 'measure': 'to taste'}
+            ]}
+        ]
+        
+        shopping_list = create_shopping_list(meal_plan, {'eggs': 4, 'salt': 1})
+        
+        assert shopping_list == [
+            {'name': 'milk', 'needed': 354.88, 'unit': 'ml'},
+            {'name': 'garlic', 'needed': 5, 'unit': 'clove'},
+            {'name': 'egg', 'needed': 1}
+        ]
+    
+    def test_create_shopping_list_groups_name_variants(self):
+        meal_plan = [
+            {'ingredients': [{'name': 'Tomatoes', 'measure': '2'}, {'name': 'milk', 'measure': '1 cup'}]},
+            {'ingredients': [{'name': 'tomato', 'measure': '3'}, {'name': 'chopped tomatoes', 'measure': '1'}]}
+        ]
+        
+        # The 4 tomatoes in the pantry are used up once, not once per spelling
+        shopping_list = create_shopping_list(meal_plan, {'tomatoes': 4, 'milk': '100 ml'})
+        
+        assert shopping_list == [
+            {'name': 'tomato', 'needed': 2},
+            {'name': 'milk', 'needed': 136.59, 'unit': 'ml'}
+        ]
+    
+    def test_create_shopping_list_subtracts_measured_stock(self):
+        meal_plan = [{'ingredients': [
+            {'name': 'flour', 'measure': '500g'},
+            {'name': 'butter', 'measure': '100 g'},
+            {'name': 'onion', 'measure': '200 g'}
+        ]}]
+        
+        shopping_list = create_shopping_list(meal_plan, {'flour': '0.2 kg', 'butter': '250g', 'onion': 1})
+        
+        # Plain pantry counts can't be weighed against grams, so any onion covers the recipe
+        assert shopping_list == [{'name': 'flour', 'needed': 300, 'unit': 'g'}]
 
 
 class TestKrogerAPI:
@@ -390,6 +749,144 @@ class TestSessionManagement:
                 assert 'state' in sess
                 assert sess['state']['pantry'] == sample_session_state.pantry
 
+    
+    def test_cookie_carries_only_session_id(self, client, sample_session_state):
+        with app.test_request_context():
+            save_session_state(sample_session_state)
+            sid = flask.session['sid']
+            assert set(flask.session.keys()) == {'sid'}
+            assert get_session_state().pantry == sample_session_state.pantry
+        assert session_store.get(sid)['user_preferences'] == {'zip_code': '12345'}
+    
+    def test_legacy_cookie_state_is_migrated(self, client):
+        with client.session_transaction() as sess:
+            sess['state'] = SessionState().to_dict()
+            sess['state']['user_preferences'] = {'zip_code': '54321'}
+        
+        client.post('/set-zipcode', json={'zipcode': '12345'})
+        
+        with client.session_transaction() as sess:
+            assert 'state' not in sess
+            assert session_store.get(sess['sid'])['user_preferences'] == {'zip_code': '12345'}
+    
+    def test_sqlite_session_store_survives_restart(self, tmp_path):
+        db_path = str(tmp_path / 'sessions.db')
+        SessionStore(db_path=db_path).set('abc', {'pantry': {'eggs': 2}})
+        
+        store = SessionStore(db_path=db_path)
+        assert store.get('abc') == {'pantry': {'eggs': 2}}
+        assert store.get('missing') is None
+        assert store.stats()['disk_hits'] == 1
+    
+    def test_fields_are_decoded_lazily(self):
+        state = SessionState({'pantry': '{"eggs":2}', 'current_meal_plan': '[{"name":"Omelette"}]'})
+        assert state.pantry == {'eggs': 2}
+        assert state.current_shopping_list == []
+        assert set(state._values) == {'pantry', 'current_shopping_list'}
+        assert state.dirty_fields() == {}
+    
+    def test_only_changed_fields_are_dirty(self):
+        state = SessionState({'pantry': '{"eggs":2}', 'user_preferences': '{}'})
+        state.pantry = {'eggs': 2}
+        state.user_preferences['zip_code'] = '12345'
+        assert state.dirty_fields() == {'user_preferences': '{"zip_code":"12345"}'}
+    
+    def test_unchanged_request_skips_session_write(self, client):
+        client.post('/set-zipcode', json={'zipcode': '12345'})
+        writes = session_store.stats()['writes']
+        
+        with patch('app.load_pantry', return_value={}):
+            client.post('/chat-with-agent', json={'message': "What's in my pantry?"})
+        
+        assert session_store.stats()['writes'] == writes
+        assert session_store.stats()['skipped_writes'] == 1
+    
+    def test_partial_write_keeps_other_fields(self, tmp_path):
+        store = SessionStore(db_path=str(tmp_path / 'sessions.db'))
+        store.set('abc', {'pantry': {'eggs': 2}, 'user_preferences': {}})
+        store.memory.clear()
+        
+        store.set_fields('abc', {'user_preferences': '{"zip_code": "12345"}'})
+        
+        assert store.get('abc') == {'pantry': {'eggs': 2}, 'user_preferences': {'zip_code': '12345'}}
+    
+    def test_sessions_are_persisted_by_default(self, client):
+        client.post('/set-zipcode', json={'zipcode': '12345'})
+        assert session_store.stats()['persistent']
+        
+        with client.session_transaction() as sess:
+            restarted = SessionStore(db_path=session_store.db_path)
+            assert restarted.get(sess['sid'])['user_preferences'] == {'zip_code': '12345'}
+    
+    def test_workers_sharing_a_database_see_each_others_writes(self, tmp_path):
+        db_path = str(tmp_path / 'sessions.db')
+        worker_a, worker_b = SessionStore(db_path=db_path), SessionStore(db_path=db_path)
+        worker_a.set('abc', {'current_meal_plan': ['plan-A'], 'user_preferences': {}})
+        assert worker_b.get('abc')['current_meal_plan'] == ['plan-A']
+        
+        worker_b.set_fields('abc', {'current_meal_plan': '["plan-B"]', 'user_preferences': '{"zip_code":"12345"}'})
+        assert worker_a.get('abc') == {'current_meal_plan': ['plan-B'], 'user_preferences': {'zip_code': '12345'}}
+        
+        # A's next partial write merges into B's fields, not a stale copy
+        worker_b.set_fields('abc', {'current_meal_plan': '["plan-C"]'})
+        worker_a.set_fields('abc', {'pantry': '{"egg":2}'})
+        assert worker_a.get('abc') == worker_b.get('abc') == {
+            'current_meal_plan': ['plan-C'], 'user_preferences': {'zip_code': '12345'}, 'pantry': {'egg': 2}
+        }
+    
+    def test_unchanged_session_is_answered_from_memory(self, tmp_path):
+        store = SessionStore(db_path=str(tmp_path / 'sessions.db'))
+        store.set('abc', {'pantry': {'egg': 2}})
+        store.set_fields('abc', {'pantry': '{"egg":3}'})
+        
+        assert store.get('abc') == {'pantry': {'egg': 3}}
+        assert store.stats()['memory_hits'] == 1
+        assert store.stats()['disk_hits'] == 0
+    
+    def test_skipped_write_extends_aging_session(self, tmp_path):
+        store = SessionStore(db_path=str(tmp_path / 'sessions.db'), ttl=100)
+        store.set('abc', {'pantry': {}})
+        fields, expires_at = store.get_fields('abc')
+        
+        store.skip_write('abc', expires_at)
+        assert store.get_fields('abc')[1] == expires_at
+        
+        store.skip_write('abc', time.time() + 10)
+        assert store.get_fields('abc')[1] > expires_at
+    
+    def test_meal_plan_is_compressed_on_disk(self, tmp_path, sample_session_state):
+        db_path = str(tmp_path / 'sessions.db')
+        store = SessionStore(db_path=db_path)
+        meal_plan = [{'name': f'Recipe {i}', 'instructions': 'Simmer the sauce gently, stirring often. ' * 20}
+                     for i in range(3)]
+        store.set('abc', {'current_meal_plan': meal_plan, 'user_preferences': {}})
+        
+        with sqlite3.connect(db_path) as conn:
+            blobs = dict(conn.execute("SELECT field, data FROM session_fields WHERE sid = 'abc'").fetchall())
+        assert blobs['current_meal_plan'].startswith(STATE_BLOB_MAGIC)
+        assert len(blobs['current_meal_plan']) < len(dump_state_json(meal_plan)) / 4
+        assert blobs['user_preferences'] == b'{}'
+        assert SessionStore(db_path=db_path).get('abc')['current_meal_plan'] == meal_plan
+        assert state_encoding_metrics()['ratio'] < 0.5
+    
+    def test_reads_sessions_stored_as_plain_json(self, tmp_path):
+        db_path = str(tmp_path / 'sessions.db')
+        SessionStore(db_path=db_path)
+        with sqlite3.connect(db_path) as conn:
+            conn.execute(
+                'INSERT INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)',
+                ('abc', '{"pantry": {"eggs": 2}, "user_preferences": {}}', time.time() + 60)
+            )
+        
+        store = SessionStore(db_path=db_path)
+        store.set_fields('abc', {'user_preferences': '{"zip_code":"12345"}'})
+        assert store.get('abc') == {'pantry': {'eggs': 2}, 'user_preferences': {'zip_code': '12345'}}
+    
+    def test_decode_state_rejects_unknown_version(self):
+        assert decode_state(encode_state('"x"')) == '"x"'
+        with pytest.raises(ValueError):
+            decode_state(STATE_BLOB_MAGIC + bytes([99]) + b'...')
+
 
 class TestLLMRecipeCreation:
     def test_normalize_ingredient_name(self):
@@ -402,6 +899,49 @@ class TestLLMRecipeCreation:
         # Test unknown ingredients
         assert normalize_ingredient_name('avocado') == 'avocado'
     
+    def test_normalize_uses_synonyms_file(self):
+        assert normalize_ingredient_name('Parmigiano-Reggiano') == 'parmesan'
+        assert normalize_ingredient_name(' scallions ') == 'green onion'
+        
+        hits = normalize_ingredient_name.cache_info().hits
+        normalize_ingredient_name('Parmigiano-Reggiano')
+        assert normalize_ingredient_name.cache_info().hits == hits + 1
+    
+    def test_singularize_word(self):
+        assert singularize_word('tomatoes') == 'tomato'
+        assert singularize_word('berries') == 'berry'
+        assert singularize_word('peaches') == 'peach'
+        assert singularize_word('leaves') == 'leaf'
+        assert singularize_word('cookies') == 'cookie'
+        assert singularize_word('onions') == 'onion'
+        assert singularize_word('asparagus') == 'asparagus'
+        assert singularize_word('molasses') == 'molasses'
+        assert singularize_word('hummus') == 'hummus'
+        assert singularize_word('peas') == 'pea'
+        assert singularize_word('chickpeas') == 'chickpea'
+        assert singularize_word('oats') == 'oat'
+    
+    def test_lemmatize_ingredient(self):
+        assert lemmatize_ingredient('Fresh Chopped Tomatoes') == 'tomato'
+        assert lemmatize_ingredient('large russet potatoes') == 'russet potato'
+        assert lemmatize_ingredient('frozen blueberries') == 'blueberry'
+        assert lemmatize_ingredient('cooked') == 'cooked'
+        
+        # Phrases that fall through the alias table still normalize to the lemma
+        assert normalize_ingredient_name('Diced Avocados') == 'avocado'
+        assert normalize_ingredient_name('sliced mushrooms') == 'mushroom'
+    
+    def test_load_ingredient_aliases(self, tmp_path):
+        synonyms_file = tmp_path / 'synonyms.json'
+        synonyms_file.write_text(json.dumps({'Coriander': ['cilantro'], 'parsley': ['Cilantro', 'flat leaf parsley']}))
+        
+        aliases = load_ingredient_aliases(str(synonyms_file))
+        
+        assert aliases == {
+            'coriander': 'coriander', 'cilantro': 'coriander', 'parsley': 'parsley', 'flat leaf parsley': 'parsley'
+        }
+        assert load_ingredient_aliases(str(tmp_path / 'missing.json')) == {}
+    
     def test_check_ingredient_availability(self):
         pantry = {'eggs': 3, 'tomatoes': 2, 'olive oil': 1}
         
@@ -420,6 +960,80 @@ class TestLLMRecipeCreation:
         assert has_milk is False
         assert quantity == 0
     
+    def test_pantry_index_matches_full_scan(self):
+        pantry = {f'item {i}': i for i in range(300)}
+        pantry.update({'Roma Tomatoes': 4, 'extra sharp cheddar': 1, 'olive oil spray': 2, 'eggplant': 1})
+        
+        def scan(name):
+            normalized = normalize_ingredient_name(name)
+            for item, quantity in pantry.items():
+                if normalized in normalize_ingredient_name(item):
+                    return True, quantity
+            return False, 0
+        
+        for name in ['tomato', 'cheddar', 'olive oil', 'egg', 'item 29', 'oi', 'saffron', 'item 3']:
+            assert check_ingredient_availability(name, pantry) == scan(name), name
+    
+    def test_fuzzy_match_against_pantry(self):
+        pantry = {'tomato': 2, 'egg': 6, 'parmesan': 1}
+        assert check_ingredient_availability('chopped tomatoes', pantry) == (True, 2)
+        assert check_ingredient_availability('Parmigiano-Reggiano', pantry) == (True, 1)
+        assert check_ingredient_availability('eggplant', pantry) == (False, 0)
+        
+        index = get_pantry_index(pantry)
+        item, score = index.best_match('tomatoe')
+        assert item == 'tomato' and 0.6 <= score < 1
+        assert index.best_match('tomatoe', threshold=0.9) == (None, 0.0)
+    
+    def test_fuzzy_match_rejects_compound_ingredients(self):
+        pantry = {name: 1 for name in ['chicken', 'rice', 'milk', 'butter', 'tomato', 'garlic', 'oil', 'sugar', 'pepper']}
+        for name in ['chicken stock', 'rice vinegar', 'coconut milk', 'peanut butter', 'tomato paste',
+                     'garlic powder', 'sesame oil', 'brown sugar', 'bell pepper', 'cayenne pepper', 'buttermilk']:
+            assert check_ingredient_availability(name, pantry) == (False, 0), name
+        
+        assert check_ingredient_availability('chiken', pantry) == (True, 1)
+        
+        meal_plan = [{'ingredients': [{'name': 'chicken stock'}, {'name': 'rice vinegar'}, {'name': 'coconut milk'}]}]
+        assert [item['name'] for item in create_shopping_list(meal_plan, pantry)] == [
+            'chicken stock', 'rice vinegar', 'coconut milk'
+        ]
+    
+    def test_shopping_list_counts_fuzzy_pantry_matches(self):
+        meal_plan = [{'ingredients': [{'name': 'Chopped Tomatoes'}, {'name': 'basil'}]},
+                     {'ingredients': [{'name': 'chopped tomatoes'}]}]
+        shopping_list = create_shopping_list(meal_plan, {'tomato': 2})
+        assert shopping_list == [{'name': 'basil', 'needed': 1}]
+    
+    def test_pantry_index_built_once_per_item_set(self):
+        pantry = {'chopped tomatoes': 2, 'fresh basil': 1}
+        for name in ['basil', 'tomato', 'garlic']:
+            check_ingredient_availability(name, pantry)
+        pantry['chopped tomatoes'] = 5
+        assert check_ingredient_availability('tomato', pantry) == (True, 5)
+        assert pantry_index_cache.stats()['misses'] == 1
+        
+        pantry['garlic'] = 3
+        check_ingredient_availability('saffron', pantry)
+        assert pantry_index_cache.stats()['misses'] == 2
+    
+    def test_pantry_index_keyed_on_version(self):
+        pantry = {'chopped tomatoes': 2, 'fresh basil': 1}
+        index = get_pantry_index(pantry, version='v1')
+        
+        # The version alone identifies the pantry, so the items aren't read again
+        with patch('app.PantryIndex', side_effect=AssertionError('rebuilt')):
+            assert get_pantry_index({}, version='v1') is index
+        
+        pantry['garlic'] = 3
+        assert get_pantry_index(pantry, version='v2') is not index
+        assert pantry_index_cache.stats()['misses'] == 2
+    
+    def test_shopping_list_looks_up_pantry_index_once(self):
+        meal_plan = [{'ingredients': [{'name': 'chopped tomatoes'}, {'name': 'basil leaves'}, {'name': 'saffron'}]}]
+        with patch('app.get_pantry_index', wraps=get_pantry_index) as mock_index:
+            create_shopping_list(meal_plan, {'tomato': 2, 'basil': 1}, pantry_version='v1')
+        mock_index.assert_called_once_with({'tomato': 2, 'basil': 1}, 'v1')
+    
     @patch('app.call_openai_with_fallback')
     def test_create_recipes_with_llm_success(self, mock_openai):
         # Mock successful LLM response
@@ -565,7 +1179,7 @@ class TestUpdatedMealPlanning:
 class TestPantryUpdateLLM:
     def dynamic_load_pantry(self):
         # Return a copy of the current session pantry
-        return flask.session['state']['pantry'].copy() if 'state' in flask.session else {}
+        return get_session_state().pantry.copy()
 
     @patch('app.save_pantry')
     @patch('app.extract_pantry_entities')
@@ -580,8 +1194,8 @@ class TestPantryUpdateLLM:
             response = client.post('/chat-with-agent', json={"message": "my eggs spoiled"})
             assert response.status_code == 200
             with client.session_transaction() as sess:
-                assert "egg" not in sess['state']['pantry']
-                assert "milk" in sess['state']['pantry']
+                assert "egg" not in session_store.get(sess['sid'])['pantry']
+                assert "milk" in session_store.get(sess['sid'])['pantry']
             assert "updated your pantry" in response.get_json()['message'].lower()
 
     @patch('app.save_pantry')
@@ -598,9 +1212,9 @@ class TestPantryUpdateLLM:
             response = client.post('/chat-with-agent', json={"message": "the bread expired and I ran out of cheese"})
             assert response.status_code == 200
             with client.session_transaction() as sess:
-                assert "bread" not in sess['state']['pantry']
-                assert "cheese" not in sess['state']['pantry']
-                assert "milk" in sess['state']['pantry']
+                assert "bread" not in session_store.get(sess['sid'])['pantry']
+                assert "cheese" not in session_store.get(sess['sid'])['pantry']
+                assert "milk" in session_store.get(sess['sid'])['pantry']
 
     @patch('app.save_pantry')
     @patch('app.extract_pantry_entities')
@@ -615,7 +1229,7 @@ class TestPantryUpdateLLM:
             response = client.post('/chat-with-agent', json={"message": "I used up 2 eggs"})
             assert response.status_code == 200
             with client.session_transaction() as sess:
-                assert sess['state']['pantry']['egg'] == 4
+                assert session_store.get(sess['sid'])['pantry']['egg'] == 4
 
     @patch('app.save_pantry')
     @patch('app.extract_pantry_entities')
@@ -630,7 +1244,7 @@ class TestPantryUpdateLLM:
             response = client.post('/chat-with-agent', json={"message": "I threw away 10 eggs"})
             assert response.status_code == 200
             with client.session_transaction() as sess:
-                assert "egg" not in sess['state']['pantry']
+                assert "egg" not in session_store.get(sess['sid'])['pantry']
 
     @patch('app.save_pantry')
     @patch('app.extract_pantry_entities')
@@ -646,8 +1260,328 @@ class TestPantryUpdateLLM:
             response = client.post('/chat-with-agent', json={"message": "I added 2 tomatoes and used up the onions"})
             assert response.status_code == 200
             with client.session_transaction() as sess:
-                assert "onion" not in sess['state']['pantry']
-                assert sess['state']['pantry']['tomato'] == 2
+                assert "onion" not in session_store.get(sess['sid'])['pantry']
+                assert session_store.get(sess['sid'])['pantry']['tomato'] == 2
+
+
+class TestPantryPromptContext:
+    def test_cuisine_matches_rank_first(self):
+        pantry = {'ketchup': 5, 'basil': 1, 'cereal': 9, 'pasta': 1}
+        ranked = [item for item, _ in rank_pantry_items(pantry, 'Italian')]
+        assert ranked[:2] == ['pasta', 'basil']
+    
+    def test_quantity_and_recency_break_ties(self):
+        pantry = {'ketchup': 1, 'cereal': 9, 'mustard': 1}
+        ranked = [item for item, _ in rank_pantry_items(pantry)]
+        # Plenty of cereal outranks everything; the newer of the two small items comes next
+        assert ranked == ['cereal', 'mustard', 'ketchup']
+    
+    def test_context_respects_token_budget(self):
+        pantry = {f'item number {i}': i for i in range(500)}
+        context = build_pantry_context(pantry, token_budget=100)
+        
+        assert estimate_tokens(context) <= 120
+        assert 'less relevant items' in context
+        assert 'item number 499 (499)' in context
+    
+    def test_small_pantry_is_listed_in_full(self):
+        context = build_pantry_context({'eggs': 3, 'milk': 1})
+        assert context == 'milk (1), eggs (3)' or context == 'eggs (3), milk (1)'
+        assert 'less relevant' not in context
+    
+    def test_empty_pantry(self):
+        assert build_pantry_context({}) == 'empty pantry'
+    
+    def test_prompt_size_stays_flat_as_pantry_grows(self):
+        baseline = estimate_tokens(get_recipe_selection_prompt({'eggs': 1}))
+        for size in (200, 2000, 20000):
+            prompt = get_recipe_selection_prompt({f'item {i}': 1 for i in range(size)})
+            assert estimate_tokens(prompt) < baseline + PANTRY_PROMPT_TOKEN_BUDGET + 20
+    
+    def test_prompt_tokens_recorded(self, client):
+        prompt = get_recipe_selection_prompt({'eggs': 3}, 'Italian')
+        stats = client.get('/metrics').get_json()['recipe_prompt_tokens']
+        assert stats['count'] == 1
+        assert stats['last_tokens'] == estimate_tokens(prompt)
+
+
+class TestBatchPantryUpdate:
+    def _fake_batch_llm(self, messages, **kwargs):
+        # Answer like the LLM would: every "N. <count> <item>" line becomes an add entity
+        prompt = messages[0]['content']
+        listed = prompt.split('Lines:\n', 1)[1].split('\n\nRespond', 1)[0]
+        result = {}
+        for entry in listed.split('\n'):
+            number, text = entry.split('. ', 1)
+            words = text.split()
+            if words[0].isdigit():
+                result[number] = [{"item": words[1], "quantity": int(words[0]), "action": "add"}]
+            elif number != '1':
+                result[number] = []
+        return json.dumps(result), None
+    
+    def test_apply_pantry_entities(self):
+        pantry = {'egg': 6, 'milk': 1}
+        apply_pantry_entities(pantry, [
+            {"item": "egg", "quantity": 2, "action": "remove"},
+            {"item": "milk", "quantity": 0, "action": "remove"},
+            {"item": "onion", "quantity": 3, "action": "add"}
+        ])
+        assert pantry == {'egg': 4, 'onion': 3}
+    
+    @patch('app.call_openai_with_fallback')
+    def test_entities_without_string_items_are_dropped(self, mock_llm):
+        mock_llm.return_value = (json.dumps([
+            {"item": None, "quantity": 1, "action": "add"},
+            {"item": ["rice"], "quantity": 2, "action": "add"},
+            {"item": " ", "quantity": 1, "action": "add"},
+            {"item": "onion", "quantity": 3, "action": "add"}
+        ]), None)
+        
+        entities = extract_pantry_entities("I bought 3 onions and some rice")
+        
+        assert entities == [{"item": "onion", "quantity": 3, "action": "add"}]
+        assert validate_pantry_entities([{"item": 5, "quantity": 1, "action": "add"}]) == []
+    
+    def test_apply_pantry_entities_uses_canonical_names(self):
+        pantry = {'potatoes': 2}
+        apply_pantry_entities(pantry, [
+            {"item": "potatoes", "quantity": 3, "action": "add"},
+            {"item": "Tomatoes", "quantity": 4, "action": "add"},
+            {"item": "tomato", "quantity": 1, "action": "remove"}
+        ])
+        assert pantry == {'potato': 5, 'tomato': 3}
+        
+        apply_pantry_entities(pantry, [
+            {"item": "chickpeas", "quantity": 2, "action": "add"},
+            {"item": "chickpea", "quantity": 1, "action": "add"}
+        ])
+        assert pantry['chickpea'] == 3 and 'chickpeas' not in pantry
+    
+    @patch('app.call_openai_with_fallback')
+    def test_lines_are_grouped_into_few_llm_calls(self, mock_llm):
+        mock_llm.side_effect = self._fake_batch_llm
+        lines = [f"{i % 5 + 1} item{i}" for i in range(60)]
+        
+        results = extract_pantry_entities_batch(lines, chunk_size=25)
+        
+        assert mock_llm.call_count == 3
+        assert len(results) == 60
+        assert results[59] == ([{"item": "item59", "quantity": 5, "action": "add"}], 'llm')
+    
+    @patch('app.call_openai_with_fallback')
+    def test_missing_lines_fall_back_to_simple_parsing(self, mock_llm):
+        mock_llm.side_effect = self._fake_batch_llm
+        
+        results = extract_pantry_entities_batch(["I finished milk", "2 onions"])
+        
+        assert results[0] == ([{"item": "milk", "quantity": 0, "action": "remove"}], 'fallback')
+        assert results[1][1] == 'llm'
+    
+    @patch('app.call_openai_with_fallback', return_value=(None, "API Error"))
+    def test_llm_failure_falls_back_for_every_line(self, mock_llm):
+        results = extract_pantry_entities_batch(["I bought 3 apples", "SUBTOTAL 4.20"])
+        assert results == [
+            ([{"item": "apples", "quantity": 3, "action": "add"}], 'fallback'),
+            ([], 'fallback')
+        ]
+    
+    @patch('app.save_pantry')
+    @patch('app.load_pantry', return_value={'onion': 1})
+    @patch('app.call_openai_with_fallback')
+    def test_batch_endpoint_writes_pantry_once(self, mock_llm, mock_load, mock_save, client):
+        mock_llm.side_effect = self._fake_batch_llm
+        receipt = "KROGER #123\n2 onion\n\n3 egg\n1 onion\nTOTAL 9.99"
+        
+        response = client.post('/pantry/batch-update', json={'text': receipt})
+        
+        assert response.status_code == 200
+        data = response.get_json()
+        assert [result['line'] for result in data['results']] == ['KROGER #123', '2 onion', '3 egg', '1 onion', 'TOTAL 9.99']
+        assert data['updated_lines'] == 3
+        mock_save.assert_called_once_with({'onion': 4, 'egg': 3}, ['onion', 'egg', 'onion'])
+    
+    def test_batch_endpoint_rejects_bad_input(self, client):
+        assert client.post('/pantry/batch-update', json={'lines': 'not a list'}).status_code == 400
+        assert client.post('/pantry/batch-update', json={'lines': ['', '  ']}).status_code == 400
+        assert client.post('/pantry/batch-update', json={'text': 5}).status_code == 400
+
+
+
+class TestBatchChat:
+    CLASSIFIED = {
+        'I bought 2 onions': {"intent": "update_pantry", "entities": [{"item": "onion", "quantity": 2, "action": "add"}]},
+        "What's in my pantry?": {"intent": "check_pantry", "entities": []},
+        'I used 1 onion': {"intent": "update_pantry", "entities": [{"item": "onion", "quantity": 1, "action": "remove"}]},
+        'I bought 3 eggs': {"intent": "update_pantry", "entities": [{"item": "egg", "quantity": 3, "action": "add"}]},
+    }
+    
+    def _fake_batch_llm(self, messages, **kwargs):
+        # Answer a batched classification prompt for every numbered message at once
+        prompt = messages[0]['content']
+        listed = prompt.split('Messages:\n', 1)[1].split('\n\nRespond', 1)[0]
+        result = {}
+        for entry in listed.split('\n'):
+            number, text = entry.split('. ', 1)
+            result[number] = self.CLASSIFIED[text]
+        return json.dumps(result), None
+    
+    def test_messages_answered_in_order_with_one_pantry_write(self, client):
+        messages = ['I bought 2 onions', "What's in my pantry?", 'I used 1 onion', 'I bought 3 eggs']
+        with patch('app.classify_intent_locally', return_value=None), \
+                patch('app.call_openai_with_fallback', side_effect=self._fake_batch_llm) as mock_llm:
+            response = client.post('/chat-with-agent/batch', json={'messages': messages})
+        
+        mock_llm.assert_called_once()
+        results = response.get_json()['results']
+        assert [result['message'] for result in results] == messages
+        assert [result['intent'] for result in results] == ['update_pantry', 'check_pantry', 'update_pantry', 'update_pantry']
+        assert results[1]['response']['message'] == 'Your pantry contains: onion: 2'
+        assert pantry_journal.stats()['appends'] == 1
+        assert load_pantry() == {'onion': 1, 'egg': 3}
+        with client.session_transaction() as sess:
+            assert session_store.get(sess['sid'])['pantry'] == {'onion': 1, 'egg': 3}
+    
+    def test_duplicate_messages_classified_once(self, client):
+        messages = ['I bought 3 eggs'] * 3
+        with patch('app.classify_intent_locally', return_value=None), \
+                patch('app.call_openai_with_fallback', side_effect=self._fake_batch_llm) as mock_llm:
+            client.post('/chat-with-agent/batch', json={'messages': messages})
+        
+        assert mock_llm.call_count == 1
+        assert '1. I bought 3 eggs\n\n' in mock_llm.call_args.kwargs['messages'][0]['content']
+        assert load_pantry() == {'egg': 9}
+    
+    @patch('app.call_openai_with_fallback')
+    def test_locally_classified_updates_extract_entities_together(self, mock_llm, client):
+        messages = [f'I bought {count} apples' for count in range(1, 9)]
+        mock_llm.return_value = (json.dumps({
+            str(count): [{"item": "apple", "quantity": count, "action": "add"}] for count in range(1, 9)
+        }), None)
+        with patch('app.classify_intent_locally', return_value='update_pantry'):
+            response = client.post('/chat-with-agent/batch', json={'messages': messages})
+        
+        mock_llm.assert_called_once()
+        assert all(result['intent'] == 'update_pantry' for result in response.get_json()['results'])
+        assert load_pantry() == {'apple': 36}
+    
+    def test_rejects_bad_input(self, client):
+        assert client.post('/chat-with-agent/batch', json={'messages': 'hi'}).status_code == 400
+        assert client.post('/chat-with-agent/batch', json={'messages': []}).status_code == 400
+        with patch('app.CHAT_BATCH_MAX_MESSAGES', 2):
+            assert client.post('/chat-with-agent/batch', json={'messages': ['a', 'b', 'c']}).status_code == 400
+
+
+class TestMealPlanStreaming:
+    RECIPES_JSON = json.dumps({
+        "recipes": [
+            {
+                "name": "Tomato {Braise}",
+                "ingredients": [
+                    {"name": "tomatoes", "has": True, "substitution": None},
+                    {"name": "basil", "has": False, "substitution": "parsley"}
+                ],
+                "instructions": 'Say "ciao" and simmer [slowly].',
+                "cooking_time": "30 minutes"
+            },
+            {
+                "name": "Garlic Toast",
+                "ingredients": [
+                    {"name": "garlic", "has": True, "substitution": None},
+                    {"name": "basil", "has": False, "substitution": None}
+                ],
+                "instructions": "Toast bread and rub with garlic.",
+                "cooking_time": "5 minutes"
+            }
+        ]
+    })
+    
+    def _chunks(self, text, size=7):
+        return [
+            {'choices': [{'delta': {'content': text[i:i + size]}}]}
+            for i in range(0, len(text), size)
+        ]
+    
+    def _events(self, body):
+        events = []
+        for block in body.strip().split('\n\n'):
+            event_line, data_line = block.split('\n')
+            events.append((event_line[len('event: '):], json.loads(data_line[len('data: '):])))
+        return events
+    
+    def test_parser_emits_each_recipe_when_complete(self):
+        parser = RecipeStreamParser()
+        emitted = []
+        first_recipe_end = self.RECIPES_JSON.index('"Garlic Toast"')
+        
+        for i, char in enumerate(self.RECIPES_JSON):
+            for recipe in parser.feed(char):
+                emitted.append((i, recipe['name']))
+        
+        assert [name for _, name in emitted] == ['Tomato {Braise}', 'Garlic Toast']
+        # The first recipe is available before the second one starts streaming
+        assert emitted[0][0] < first_recipe_end
+    
+    def test_parser_ignores_text_around_json(self):
+        parser = RecipeStreamParser()
+        recipes = parser.feed("```json\n" + self.RECIPES_JSON + "\n```")
+        assert len(recipes) == 2
+    
+    def test_shopping_list_from_recipes(self):
+        recipes = json.loads(self.RECIPES_JSON)['recipes']
+        assert shopping_list_from_recipes(recipes) == [{'name': 'basil', 'needed': 2}]
+    
+    def test_detect_cuisine(self):
+        assert detect_cuisine("I want Italian food") == 'Italian'
+        assert detect_cuisine("Chinese recipes please") == 'Chinese'
+        assert detect_cuisine("Something quick") is None
+    
+    def test_stream_endpoint_sends_recipes_then_shopping_list(self, client):
+        with patch('app.load_pantry', return_value={'tomatoes': 3, 'garlic': 2}):
+            with patch('openai.ChatCompletion.create', return_value=iter(self._chunks(self.RECIPES_JSON))):
+                response = client.post('/chat-with-agent/stream', json={'message': 'What can I cook?'})
+                body = response.get_data(as_text=True)
+        
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        events = self._events(body)
+        assert [event for event, _ in events] == ['recipe', 'recipe', 'shopping_list', 'done']
+        assert events[0][1]['name'] == 'Tomato {Braise}'
+        assert events[2][1] == [{'name': 'basil', 'needed': 2}]
+        assert '2 recipes' in events[3][1]['message']
+        with client.session_transaction() as sess:
+            stored = session_store.get(sess['sid'])
+        assert [recipe['name'] for recipe in stored['current_meal_plan']] == ['Tomato {Braise}', 'Garlic Toast']
+        assert stored['current_shopping_list'] == [{'name': 'basil', 'needed': 2}]
+    
+    def test_stream_endpoint_falls_back_when_llm_fails(self, client):
+        with patch('app.load_pantry', return_value={'eggs': 3}):
+            with patch('openai.ChatCompletion.create', side_effect=Exception("API Error")):
+                response = client.post('/chat-with-agent/stream', json={'message': 'What can I cook?'})
+                events = self._events(response.get_data(as_text=True))
+        
+        assert events[0] == ('recipe', create_fallback_recipes({'eggs': 3})[0])
+        assert events[-1][0] == 'done'
+    
+    def test_stream_endpoint_empty_pantry(self, client):
+        with patch('app.load_pantry', return_value={}):
+            with patch('openai.ChatCompletion.create') as mock_create:
+                response = client.post('/chat-with-agent/stream', json={'message': 'What can I cook?'})
+                events = self._events(response.get_data(as_text=True))
+        
+        mock_create.assert_not_called()
+        assert 'pasta' in events[0][1]['name'].lower()
+    
+    def test_streamed_response_is_cached_for_regular_path(self, client):
+        pantry = {'tomatoes': 3, 'garlic': 2}
+        with patch('app.load_pantry', return_value=pantry):
+            with patch('openai.ChatCompletion.create', return_value=iter(self._chunks(self.RECIPES_JSON))):
+                client.post('/chat-with-agent/stream', json={'message': 'What can I cook?'}).get_data()
+        
+        with patch('openai.ChatCompletion.create', side_effect=Exception("API Error")):
+            recipes = create_recipes_with_llm(pantry)
+        
+        assert [recipe['name'] for recipe in recipes] == ['Tomato {Braise}', 'Garlic Toast']
 
 
 if __name__ == '__main__':
@@ -1,11 +1,14 @@
 import pytest
 import json
 import tempfile
-from unittest.mock import patch, mock_open
+import threading
+import time
+from unittest.mock import patch, mock_open, MagicMock
 import responses
 from app import (
     app, extract_pantry_entities, fetch_recipes, create_shopping_list,
-    search_kroger_products, find_kroger_location, add_items_to_kroger_cart
+    search_kroger_products, find_kroger_location, add_items_to_kroger_cart,
+    SingleFlight, call_openai_with_fallback, llm_flight, recipe_flight, kroger_flight
 )
 
 
@@ -289,5 +292,112 @@ class TestAPIEndpointEdgeCases:
                 assert 'trouble adding items' in data['message']
 
 
+class TestRequestCoalescing:
+    def _run_concurrently(self, fn, count=5):
+        barrier = threading.Barrier(count)
+        results = [None] * count
+        
+        def worker(index):
+            barrier.wait()
+            results[index] = fn()
+        
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+    
+    def test_single_flight_shares_result(self):
+        flight = SingleFlight()
+        calls = []
+        
+        def slow():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'value': 42}
+        
+        results = self._run_concurrently(lambda: flight.do('key', slow))
+        
+        assert len(calls) == 1
+        assert all(result == {'value': 42} for result in results)
+        # Waiters get copies, not the leader's object
+        assert len({id(result) for result in results}) == 5
+        assert flight.stats() == {'calls': 1, 'coalesced': 4, 'in_flight': 0}
+    
+    def test_single_flight_shares_exception(self):
+        flight = SingleFlight()
+        
+        def failing():
+            time.sleep(0.1)
+            raise ValueError("boom")
+        
+        def call():
+            try:
+                flight.do('key', failing)
+            except ValueError as e:
+                return str(e)
+        
+        assert self._run_concurrently(call, count=3) == ['boom'] * 3
+    
+    def test_sequential_calls_are_not_coalesced(self):
+        flight = SingleFlight()
+        flight.do('key', lambda: 1)
+        flight.do('key', lambda: 2)
+        assert flight.stats()['calls'] == 2
+        assert flight.stats()['coalesced'] == 0
+    
+    def test_identical_llm_calls_coalesce(self):
+        def slow_create(**kwargs):
+            time.sleep(0.2)
+            mock_response = MagicMock()
+            mock_response.choices = [MagicMock()]
+            mock_response.choices[0].message.content = "request_meal_plan"
+            return mock_response
+        
+        messages = [{"role": "user", "content": "What can I cook tonight"}]
+        with patch('openai.ChatCompletion.create', side_effect=slow_create) as mock_create:
+            results = self._run_concurrently(lambda: call_openai_with_fallback(messages, cache_class=None))
+        
+        assert mock_create.call_count == 1
+        assert results == [("request_meal_plan", None)] * 5
+        assert llm_flight.stats()['coalesced'] == 4
+    
+    def test_identical_recipe_fetches_coalesce(self, sample_meal_db_response):
+        def slow_get(url):
+            time.sleep(0.2)
+            response = MagicMock()
+            response.json.return_value = sample_meal_db_response
+            return response
+        
+        with patch('app.requests.get', side_effect=slow_get) as mock_get:
+            results = self._run_concurrently(lambda: fetch_recipes(cuisine='Italian'))
+        
+        assert mock_get.call_count == 1
+        assert all(result[0]['name'] == 'Spicy Arrabiata Penne' for result in results)
+        assert recipe_flight.stats()['coalesced'] == 4
+    
+    def test_identical_kroger_searches_coalesce(self):
+        def slow_get(url, headers=None, params=None):
+            time.sleep(0.2)
+            response = MagicMock(status_code=200)
+            response.json.return_value = {'data': [{'productId': params['filter.term']}]}
+            return response
+        
+        with patch('app.requests.get', side_effect=slow_get) as mock_get:
+            results = self._run_concurrently(lambda: search_kroger_products('tomatoes'))
+        
+        assert mock_get.call_count == 1
+        assert results == [[{'productId': 'tomatoes'}]] * 5
+    
+    @responses.activate
+    def test_coalescing_metrics(self, client):
+        responses.add(responses.GET, 'https://api.kroger.com/v1/products', json={'data': []}, status=200)
+        search_kroger_products('tomatoes')
+        data = client.get('/metrics').get_json()
+        assert data['coalescing']['kroger_products']['calls'] == 1
+        assert 'llm' in data['coalescing']
+
+
 if __name__ == '__main__':
     pytest.main([__file__])
\ No newline at end of file
@@ -1,10 +1,17 @@
 import pytest
 import json
+import time
 from unittest.mock import patch, MagicMock
 from app import (
-    call_openai_with_fallback, get_intent_classification_prompt, 
-    get_entity_extraction_prompt, recognize_intent, extract_pantry_entities
+    app, call_openai_with_fallback, get_intent_classification_prompt, 
+    get_entity_extraction_prompt, recognize_intent, extract_pantry_entities,
+    LRUCache, ResponseCache, get_intent_and_entity_prompt, classify_and_extract,
+    LocalIntentClassifier, local_intent_classifier, load_intent_classifier,
+    call_openai_many, llm_http_session, message_fingerprint, intent_cache,
+    CircuitBreaker, openai_breaker, create_recipes_with_llm, create_fallback_recipes, LLM_CALL_TIMEOUTS,
+    stream_openai_with_fallback
 )
+import openai
 
 
 class TestOpenAIIntegration:
@@ -296,5 +303,528 @@ class TestFallbackBehavior:
         assert result[0]["action"] == "remove"
 
 
+class TestFusedIntentExtraction:
+    """Test combined intent classification and entity extraction"""
+    
+    def test_intent_and_entity_prompt_format(self):
+        """Test combined prompt is properly formatted"""
+        formatted = get_intent_and_entity_prompt().format(message="I bought 2 onions")
+        
+        assert "I bought 2 onions" in formatted
+        assert "update_pantry" in formatted
+        assert "entities" in formatted
+        assert "JSON" in formatted
+    
+    @patch('app.call_openai_with_fallback')
+    def test_update_pantry_single_call(self, mock_llm):
+        """Test intent and entities come back from one LLM call"""
+        mock_llm.return_value = ('{"intent": "update_pantry", "entities": [{"item": "onion", "quantity": 2, "action": "add"}]}', None)
+        
+        intent, entities = classify_and_extract("I bought 2 onions")
+        
+        assert intent == "update_pantry"
+        assert entities == [{"item": "onion", "quantity": 2, "action": "add"}]
+        mock_llm.assert_called_once()
+    
+    @patch('app.call_openai_with_fallback')
+    def test_other_intents_have_no_entities(self, mock_llm):
+        """Test non-update intents don't return entities"""
+        mock_llm.return_value = ('{"intent": "check_pantry", "entities": []}', None)
+        
+        assert classify_and_extract("What's in my pantry?") == ("check_pantry", None)
+    
+    @patch('app.call_openai_with_fallback')
+    def test_invalid_entities_are_rejected(self, mock_llm):
+        """Test entity validation still applies to the combined response"""
+        mock_llm.return_value = ('{"intent": "update_pantry", "entities": [{"wrong": "structure"}]}', None)
+        
+        assert classify_and_extract("I bought 3 apples") == ("update_pantry", None)
+    
+    @patch('app.call_openai_with_fallback')
+    def test_invalid_intent_falls_back_to_keywords(self, mock_llm):
+        """Test intent validation still applies to the combined response"""
+        mock_llm.return_value = ('{"intent": "invalid_intent", "entities": []}', None)
+        
+        assert classify_and_extract("I bought 3 apples") == ("update_pantry", None)
+    
+    @patch('app.call_openai_with_fallback')
+    def test_invalid_json_falls_back_to_keywords(self, mock_llm):
+        """Test non-JSON responses fall back to keyword matching"""
+        mock_llm.return_value = ("update_pantry", None)
+        
+        assert classify_and_extract("Show me some recipes") == ("request_meal_plan", None)
+    
+    @patch('app.call_openai_with_fallback')
+    def test_llm_failure_falls_back_to_keywords(self, mock_llm):
+        """Test LLM failure falls back to keyword matching"""
+        mock_llm.return_value = (None, "API Error")
+        
+        assert classify_and_extract("What's in my pantry?") == ("check_pantry", None)
+    
+    @patch('app.save_pantry')
+    @patch('app.load_pantry', return_value={})
+    @patch('app.call_openai_with_fallback')
+    def test_chat_update_pantry_uses_one_llm_call(self, mock_llm, mock_load, mock_save):
+        """Test an update_pantry chat message costs a single LLM round trip"""
+        mock_llm.return_value = ('{"intent": "update_pantry", "entities": [{"item": "onion", "quantity": 2, "action": "add"}]}', None)
+        
+        response = app.test_client().post('/chat-with-agent', json={'message': 'I bought 2 onions'})
+        
+        assert "updated your pantry" in response.get_json()['message']
+        mock_llm.assert_called_once()
+        assert mock_save.call_args[0][0] == {"onion": 2}
+    
+    @patch('app.save_pantry')
+    @patch('app.load_pantry', return_value={})
+    @patch('app.extract_pantry_entities', return_value=[{"item": "onion", "quantity": 2, "action": "add"}])
+    @patch('app.recognize_intent', return_value='update_pantry')
+    def test_chat_with_fusion_disabled(self, mock_intent, mock_extract, mock_load, mock_save):
+        """Test the two-call path is used when fusion is turned off"""
+        with patch('app.FUSED_INTENT_EXTRACTION', False):
+            app.test_client().post('/chat-with-agent', json={'message': 'I bought 2 onions'})
+        
+        mock_intent.assert_called_once()
+        mock_extract.assert_called_once()
+
+
+class TestLocalIntentClassifier:
+    """Test the local intent classifier tier ahead of the LLM"""
+    
+    @pytest.fixture(autouse=True)
+    def enable_local_tier(self, monkeypatch):
+        monkeypatch.setattr('app.INTENT_CONFIDENCE_THRESHOLD', 0.85)
+    
+    def test_shipped_examples_are_loaded(self):
+        """Test the classifier is trained from the bundled examples"""
+        assert set(local_intent_classifier.intents) == {
+            'update_pantry', 'check_pantry', 'request_meal_plan', 'add_to_cart', 'clarification'
+        }
+    
+    def test_confident_predictions(self):
+        """Test common phrasings are classified with high confidence"""
+        test_cases = [
+            ("show my pantry", "check_pantry"),
+            ("Show me my inventory", "check_pantry"),
+            ("my eggs spoiled", "update_pantry"),
+            ("Create a meal plan", "request_meal_plan"),
+            ("Purchase from Kroger", "add_to_cart")
+        ]
+        
+        for message, expected_intent in test_cases:
+            intent, confidence = local_intent_classifier.predict(message)
+            assert intent == expected_intent
+            assert confidence >= 0.85
+    
+    def test_unknown_vocabulary_has_no_confidence(self):
+        """Test messages with no known features defer to the LLM"""
+        assert local_intent_classifier.predict("qqq zzz") == (None, 0.0)
+        assert local_intent_classifier.predict("") == (None, 0.0)
+    
+    def test_untrained_classifier(self, tmp_path):
+        """Test a missing examples file disables the local tier instead of failing"""
+        classifier = load_intent_classifier(str(tmp_path / "missing.json"))
+        assert classifier.predict("show my pantry") == (None, 0.0)
+    
+    def test_custom_examples(self):
+        """Test the classifier can be trained from arbitrary labeled examples"""
+        classifier = LocalIntentClassifier({
+            'check_pantry': ["show my pantry", "what do I have"],
+            'clarification': ["hello", "thanks"]
+        })
+        
+        intent, _ = classifier.predict("show pantry")
+        assert intent == 'check_pantry'
+    
+    @patch('app.call_openai_with_fallback')
+    def test_confident_local_result_skips_llm(self, mock_llm):
+        """Test the LLM isn't called when the local classifier is confident"""
+        assert recognize_intent("show my pantry") == "check_pantry"
+        mock_llm.assert_not_called()
+    
+    @patch('app.call_openai_with_fallback')
+    def test_low_confidence_goes_to_llm(self, mock_llm):
+        """Test the LLM is called when the local classifier isn't confident"""
+        mock_llm.return_value = ("clarification", None)
+        
+        assert recognize_intent("xyzzy qwerty") == "clarification"
+        mock_llm.assert_called_once()
+    
+    @patch('app.call_openai_with_fallback')
+    def test_threshold_is_configurable(self, mock_llm, monkeypatch):
+        """Test raising the threshold sends everything to the LLM"""
+        monkeypatch.setattr('app.INTENT_CONFIDENCE_THRESHOLD', 1.1)
+        mock_llm.return_value = ("check_pantry", None)
+        
+        recognize_intent("show my pantry")
+        mock_llm.assert_called_once()
+    
+    @patch('app.call_openai_with_fallback')
+    def test_fused_path_uses_local_tier(self, mock_llm):
+        """Test classify_and_extract also consults the local classifier first"""
+        assert classify_and_extract("show my pantry") == ("check_pantry", None)
+        mock_llm.assert_not_called()
+    
+    @patch('app.call_openai_with_fallback')
+    def test_tier_metrics(self, mock_llm):
+        """Test the metrics endpoint counts the tier that resolved each intent"""
+        mock_llm.side_effect = [("clarification", None), (None, "API Error")]
+        
+        recognize_intent("show my pantry")
+        recognize_intent("xyzzy qwerty")
+        recognize_intent("zorp blat")
+        recognize_intent("qwerty xyzzy")
+        
+        tiers = app.test_client().get('/metrics').get_json()['intent_tiers']
+        assert tiers == {'cache': 1, 'local': 1, 'llm': 1, 'keyword': 1}
+
+
+class TestLLMClientDeadlines:
+    """Test timeouts, request deadlines and concurrency of the LLM client"""
+    
+    def _slow_create(self, delay, content="ok"):
+        def create(**kwargs):
+            time.sleep(delay)
+            mock_response = MagicMock()
+            mock_response.choices = [MagicMock()]
+            mock_response.choices[0].message.content = kwargs['messages'][0]['content'] + ":" + content
+            return mock_response
+        return create
+    
+    def test_uses_pooled_keep_alive_session(self):
+        """Test OpenAI requests go through the shared connection pool"""
+        assert openai.requestssession is llm_http_session
+        assert llm_http_session.get_adapter('https://api.openai.com')._pool_maxsize >= 1
+    
+    def test_request_timeout_is_passed_to_openai(self):
+        """Test every call carries a per-call timeout"""
+        with patch('openai.ChatCompletion.create', side_effect=self._slow_create(0)) as mock_create:
+            call_openai_with_fallback([{"role": "user", "content": "test"}])
+        
+        assert 0 < mock_create.call_args.kwargs['request_timeout'] <= 8
+    
+    def test_timeout_depends_on_call_class(self):
+        """Test long meal plan calls get a longer timeout than short classification calls"""
+        with patch('openai.ChatCompletion.create', side_effect=self._slow_create(0)) as mock_create:
+            call_openai_with_fallback([{"role": "user", "content": "intent"}], max_tokens=50, cache_class='intent')
+            call_openai_with_fallback([{"role": "user", "content": "plan"}], max_tokens=1000, cache_class='meal_plan')
+        
+        intent_timeout, meal_plan_timeout = [call.kwargs['request_timeout'] for call in mock_create.call_args_list]
+        assert intent_timeout == LLM_CALL_TIMEOUTS['intent']
+        assert meal_plan_timeout == LLM_CALL_TIMEOUTS['meal_plan'] > intent_timeout
+    
+    def test_slow_call_times_out(self):
+        """Test a call exceeding the per-call timeout returns an error instead of blocking"""
+        with patch.dict('app.LLM_CALL_TIMEOUTS', {'default': 0.05}):
+            with patch('openai.ChatCompletion.create', side_effect=self._slow_create(0.5)):
+                started = time.monotonic()
+                result, error = call_openai_with_fallback([{"role": "user", "content": "test"}])
+                elapsed = time.monotonic() - started
+        
+        assert result is None
+        assert "timed out" in error
+        assert elapsed < 0.4
+    
+    def test_expired_deadline_skips_call(self):
+        """Test no call is made once the deadline has passed"""
+        with patch('openai.ChatCompletion.create') as mock_create:
+            result, error = call_openai_with_fallback(
+                [{"role": "user", "content": "test"}], deadline=time.monotonic() - 1
+            )
+        
+        assert result is None
+        assert "deadline" in error
+        mock_create.assert_not_called()
+    
+    def test_request_budget_falls_back_to_keywords(self):
+        """Test a request whose budget is spent still gets a keyword-matched answer"""
+        with patch('app.LLM_REQUEST_BUDGET', 0):
+            with patch('app.load_pantry', return_value={}):
+                with patch('openai.ChatCompletion.create') as mock_create:
+                    response = app.test_client().post('/chat-with-agent', json={'message': "What's in my pantry?"})
+        
+        assert 'pantry is empty' in response.get_json()['message']
+        mock_create.assert_not_called()
+        assert app.test_client().get('/metrics').get_json()['llm_client']['deadline_exceeded'] >= 1
+    
+    def test_many_calls_run_concurrently(self):
+        """Test call_openai_many keeps several calls in flight at once"""
+        calls = [{"messages": [{"role": "user", "content": f"call {i}"}]} for i in range(4)]
+        with patch('openai.ChatCompletion.create', side_effect=self._slow_create(0.2)):
+            started = time.monotonic()
+            results = call_openai_many(calls)
+            elapsed = time.monotonic() - started
+        
+        assert [result for result, _ in results] == [f"call {i}:ok" for i in range(4)]
+        assert elapsed < 0.6
+
+
+class TestIntentFingerprintCache:
+    """Test the normalized-fingerprint cache in front of intent recognition"""
+    
+    def test_fingerprint_normalizes_variations(self):
+        """Test small variations of a message share a fingerprint"""
+        variations = ["What's in my pantry?", "whats in my pantry", "What's in my pantry??", "WHAT\u2019S IN MY PANTRY"]
+        assert {message_fingerprint(message) for message in variations} == {"? pantry whats"}
+    
+    def test_fingerprint_sorts_tokens_and_keeps_quantities(self):
+        """Test token order doesn't matter but numbers are kept"""
+        assert message_fingerprint("I bought 2 onions") == message_fingerprint("2 onions, bought!")
+        assert message_fingerprint("I bought 2 onions") != message_fingerprint("I bought 3 onions")
+    
+    def test_questions_and_statements_have_different_fingerprints(self):
+        """Test dropping question words doesn't turn a question into the matching statement"""
+        assert message_fingerprint("Do I have eggs?") != message_fingerprint("I have eggs")
+        assert message_fingerprint("Is there milk") != message_fingerprint("There is milk")
+        assert message_fingerprint("Do I have eggs?") == message_fingerprint("do i have eggs")
+    
+    @patch('app.call_openai_with_fallback')
+    def test_cached_question_does_not_answer_statement(self, mock_llm):
+        """Test a cached check_pantry question isn't reused for a pantry update"""
+        mock_llm.side_effect = [("check_pantry", None), ("update_pantry", None)]
+        
+        assert recognize_intent("Do I have eggs?") == "check_pantry"
+        assert recognize_intent("I have eggs") == "update_pantry"
+    
+    @patch('app.call_openai_with_fallback')
+    def test_variations_hit_the_cache(self, mock_llm):
+        """Test only the first phrasing reaches the LLM"""
+        mock_llm.return_value = ("check_pantry", None)
+        
+        assert recognize_intent("What's in my pantry?") == "check_pantry"
+        assert recognize_intent("whats in my pantry") == "check_pantry"
+        assert recognize_intent("What's in my pantry??") == "check_pantry"
+        
+        mock_llm.assert_called_once()
+        assert intent_cache.stats()['hits'] == 2
+    
+    @patch('app.call_openai_with_fallback')
+    def test_keyword_fallback_is_not_cached(self, mock_llm):
+        """Test a keyword-matched answer is retried with the LLM next time"""
+        mock_llm.side_effect = [(None, "API Error"), ("clarification", None)]
+        
+        assert recognize_intent("What's in my pantry?") == "check_pantry"
+        assert recognize_intent("What's in my pantry?") == "clarification"
+        assert mock_llm.call_count == 2
+    
+    @patch('app.call_openai_with_fallback')
+    def test_cache_shared_with_fused_path(self, mock_llm):
+        """Test classify_and_extract reuses cached intents without extracting entities"""
+        mock_llm.return_value = ('{"intent": "request_meal_plan", "entities": []}', None)
+        
+        classify_and_extract("What can I cook tonight?")
+        assert classify_and_extract("what can i cook tonight") == ("request_meal_plan", None)
+        mock_llm.assert_called_once()
+    
+    def test_cache_is_bounded(self):
+        """Test the intent cache evicts least recently used fingerprints"""
+        with patch.object(intent_cache, 'max_entries', 2):
+            for i in range(3):
+                intent_cache.set(f"message {i}", "clarification")
+            
+            assert len(intent_cache) == 2
+            assert intent_cache.get("message 0") is None
+
+
+class TestCircuitBreaker:
+    """Test the circuit breaker that short-circuits OpenAI during outages"""
+    
+    def _trip(self, breaker):
+        for _ in range(breaker.min_calls):
+            breaker.allow()
+            breaker.record_failure()
+    
+    def test_trips_after_error_rate_reached(self):
+        """Test the breaker opens once enough recent calls failed"""
+        breaker = CircuitBreaker(window=10, min_calls=4, error_rate=0.5, cooldown=30)
+        for outcome in [True, False, True]:
+            breaker.record_success() if outcome else breaker.record_failure()
+        assert breaker.state == 'closed'
+        
+        breaker.record_failure()
+        assert breaker.state == 'open'
+        assert breaker.allow() is False
+        assert breaker.stats()['short_circuited'] == 1
+    
+    def test_needs_minimum_calls(self):
+        """Test a single early failure doesn't trip the breaker"""
+        breaker = CircuitBreaker(min_calls=5)
+        breaker.record_failure()
+        assert breaker.state == 'closed'
+    
+    def test_half_open_probe_closes_on_success(self):
+        """Test one probe is allowed after the cooldown and success closes the breaker"""
+        breaker = CircuitBreaker(min_calls=2, cooldown=10)
+        with patch('app.time.monotonic', return_value=100):
+            self._trip(breaker)
+        
+        with patch('app.time.monotonic', return_value=111):
+            assert breaker.allow() is True
+            assert breaker.state == 'half_open'
+            # Only one probe at a time
+            assert breaker.allow() is False
+            breaker.record_success()
+        
+        assert breaker.state == 'closed'
+        assert breaker.allow() is True
+    
+    def test_half_open_probe_reopens_on_failure(self):
+        """Test a failed probe re-opens the breaker for another cooldown"""
+        breaker = CircuitBreaker(min_calls=2, cooldown=10)
+        with patch('app.time.monotonic', return_value=100):
+            self._trip(breaker)
+        
+        with patch('app.time.monotonic', return_value=111):
+            assert breaker.allow() is True
+            breaker.record_failure()
+            assert breaker.state == 'open'
+        
+        with patch('app.time.monotonic', return_value=115):
+            assert breaker.allow() is False
+        
+        assert breaker.stats()['times_opened'] == 2
+    
+    def test_empty_stream_probe_closes_breaker(self):
+        """Test a half-open probe whose stream ends without chunks still settles the breaker"""
+        with patch('app.time.monotonic', return_value=100):
+            self._trip(openai_breaker)
+        
+        with patch('app.time.monotonic', return_value=100 + openai_breaker.cooldown + 1), \
+                patch('openai.ChatCompletion.create', return_value=iter([])):
+            assert list(stream_openai_with_fallback([{"role": "user", "content": "test"}], cache_class=None)) == []
+        
+        assert openai_breaker.state == 'closed'
+        assert openai_breaker.allow() is True
+    
+    def test_open_breaker_skips_openai(self):
+        """Test no API call is attempted while the breaker is open"""
+        self._trip(openai_breaker)
+        
+        with patch('openai.ChatCompletion.create') as mock_create:
+            result, error = call_openai_with_fallback([{"role": "user", "content": "test"}])
+        
+        assert result is None
+        assert "circuit breaker" in error
+        mock_create.assert_not_called()
+    
+    def test_outage_degrades_to_local_fallbacks(self):
+        """Test an outage trips the breaker and later calls fall back without waiting"""
+        with patch('openai.ChatCompletion.create', side_effect=Exception("Service Unavailable")) as mock_create:
+            for i in range(10):
+                call_openai_with_fallback([{"role": "user", "content": f"test {i}"}])
+            
+            assert mock_create.call_count == openai_breaker.min_calls
+            assert recognize_intent("What's in my pantry?") == "check_pantry"
+            assert create_recipes_with_llm({'eggs': 3}) == create_fallback_recipes({'eggs': 3})
+            assert mock_create.call_count == openai_breaker.min_calls
+    
+    def test_breaker_state_in_metrics(self):
+        """Test the metrics endpoint exposes the breaker state"""
+        self._trip(openai_breaker)
+        
+        stats = app.test_client().get('/metrics').get_json()['circuit_breaker']
+        assert stats['state'] == 'open'
+        assert stats['times_opened'] == 1
+
+
+class TestLLMResponseCache:
+    """Test caching of LLM responses in front of the OpenAI API"""
+    
+    def _mock_response(self, content):
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = content
+        return mock_response
+    
+    def test_repeated_call_is_served_from_cache(self):
+        """Test identical prompts only reach the API once"""
+        messages = [{"role": "user", "content": "What's in my pantry?"}]
+        with patch('openai.ChatCompletion.create', return_value=self._mock_response("check_pantry")) as mock_create:
+            first, _ = call_openai_with_fallback(messages, max_tokens=50, cache_class='intent')
+            second, error = call_openai_with_fallback(messages, max_tokens=50, cache_class='intent')
+        
+        assert first == second == "check_pantry"
+        assert error is None
+        assert mock_create.call_count == 1
+    
+    def test_cache_key_includes_max_tokens(self):
+        """Test the same messages with a different max_tokens are cached separately"""
+        messages = [{"role": "user", "content": "test"}]
+        with patch('openai.ChatCompletion.create', return_value=self._mock_response("ok")) as mock_create:
+            call_openai_with_fallback(messages, max_tokens=50)
+            call_openai_with_fallback(messages, max_tokens=300)
+        
+        assert mock_create.call_count == 2
+    
+    def test_errors_are_not_cached(self):
+        """Test a failed call does not poison the cache"""
+        messages = [{"role": "user", "content": "test"}]
+        with patch('openai.ChatCompletion.create', side_effect=Exception("API Error")):
+            result, error = call_openai_with_fallback(messages)
+            assert result is None
+        
+        with patch('openai.ChatCompletion.create', return_value=self._mock_response("recovered")):
+            result, error = call_openai_with_fallback(messages)
+            assert result == "recovered"
+    
+    def test_cache_bypass(self):
+        """Test cache_class=None always calls the API"""
+        messages = [{"role": "user", "content": "test"}]
+        with patch('openai.ChatCompletion.create', return_value=self._mock_response("ok")) as mock_create:
+            call_openai_with_fallback(messages, cache_class=None)
+            call_openai_with_fallback(messages, cache_class=None)
+        
+        assert mock_create.call_count == 2
+    
+    def test_entries_expire_per_class(self):
+        """Test each entry class uses its own TTL"""
+        cache = ResponseCache(ttls={'intent': 100, 'meal_plan': 10, 'default': 5})
+        with patch('app.time.time', return_value=1000):
+            cache.set('a', 'intent-value', 'intent')
+            cache.set('b', 'plan-value', 'meal_plan')
+        
+        with patch('app.time.time', return_value=1050):
+            assert cache.get('a') == 'intent-value'
+            assert cache.get('b') is None
+    
+    def test_lru_eviction(self):
+        """Test the memory tier evicts the least recently used entry"""
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.get('c') == 3
+        assert cache.stats()['evictions'] == 1
+    
+    def test_sqlite_tier_persists_across_instances(self, tmp_path):
+        """Test responses survive a restart when the SQLite tier is enabled"""
+        db_path = str(tmp_path / "llm_cache.db")
+        ResponseCache(db_path=db_path).set('key', 'value', 'intent')
+        
+        restarted = ResponseCache(db_path=db_path)
+        assert restarted.get('key') == 'value'
+        assert restarted.get('key') == 'value'
+        
+        stats = restarted.stats()
+        assert stats['disk_hits'] == 1
+        assert stats['memory_hits'] == 1
+    
+    def test_hit_and_miss_counts_in_metrics(self):
+        """Test the metrics endpoint reports cache hits and misses"""
+        messages = [{"role": "user", "content": "test"}]
+        with patch('openai.ChatCompletion.create', return_value=self._mock_response("ok")):
+            call_openai_with_fallback(messages)
+            call_openai_with_fallback(messages)
+        
+        response = app.test_client().get('/metrics')
+        stats = response.get_json()['llm_cache']
+        assert stats['misses'] == 1
+        assert stats['memory_hits'] == 1
+        assert stats['hit_rate'] == 0.5
+
+
 if __name__ == '__main__':
     pytest.main([__file__])
\ No newline at end of file